@@ -0,0 +1,44 @@
+# Copyright (C) 2007-2020, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from django.urls import reverse
+from fluo.db import models
+from posts.models import PostModel, PostModelTranslation
+
+
+class Category(models.CategoryModel):
+    pass
+
+
+class Post(PostModel):
+    categories = models.ManyToManyField(Category, blank=True, related_name="posts")
+
+    class Meta(PostModel.Meta):
+        ordering = ["-pub_date_begin"]
+
+    def get_absolute_url(self):
+        return reverse("post-detail", kwargs={"slug": self.slug})
+
+
+class PostTranslation(PostModelTranslation):
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="translations")
+
+    class Meta:
+        unique_together = [("post", "language")]
@@ -0,0 +1,281 @@
+# Copyright (C) 2007-2020, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Benchmarks of the posts query and render hot paths, on SQLite.
+
+    python -m benchmarks.run --rows 1k --output report.json
+    python -m benchmarks.run --rows 100k --repeat 20 --output report.json
+
+The synthetic dataset is generated once per size and seed (and reused by
+the next runs), so reports of different runs are comparable.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+
+SIZES = {"1k": 1000, "100k": 100000, "1m": 1000000}
+# share of the posts translated in each language, the default one excluded
+TRANSLATIONS = {"it": 0.6, "de": 0.3, "fr": 0.15, "es": 0.05}
+CATEGORIES = ["news", "events", "blog", "press", "releases", "jobs", "tips", "reviews", "interviews", "misc"]
+WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore et dolore "
+    "magna aliqua enim ad minim veniam quis nostrud exercitation ullamco laboris nisi aliquip ex ea commodo"
+).split()
+
+
+def setup(rows, seed):
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "benchmarks.settings")
+    os.environ.setdefault(
+        "POSTS_BENCHMARK_DB", os.path.join(tempfile.gettempdir(), "posts-benchmark-%d-%d.sqlite3" % (rows, seed))
+    )
+    import django
+
+    django.setup()
+
+    from django.core.management import call_command
+
+    call_command("migrate", run_syncdb=True, verbosity=0)
+
+
+def sentence(rnd, words):
+    return " ".join(rnd.choice(WORDS) for i in range(words))
+
+
+def generate(rows, seed, text_words, batch_size=5000):
+    """
+    Fill the database with ``rows`` posts: 90% published (5% of them not
+    yet or no more visible), 2% restricted to a user, one to three
+    categories with a skewed distribution and ``TRANSLATIONS`` translations.
+    """
+    from django.contrib.auth import get_user_model
+    from django.db import transaction
+    from django.utils import timezone
+
+    from .models import Category, Post, PostTranslation
+
+    count = Post.objects.count()
+    if count == rows:
+        return
+    if count:
+        raise SystemExit("%s holds %d posts instead of %d, delete it" % (os.environ["POSTS_BENCHMARK_DB"], count, rows))
+    rnd = random.Random(seed)
+    now = timezone.now()
+    user = get_user_model().objects.create_superuser("admin", "admin@example.com", "admin")
+    for name in CATEGORIES:
+        if not Category.objects.filter(name=name).exists():
+            Category(name=name).save()
+    categories = list(Category.objects.order_by("pk").values_list("pk", flat=True))
+    weights = [1 / (i + 1) for i in range(len(categories))]
+    PostCategory = Post.categories.through
+    PostUser = Post.users.through
+
+    for start in range(0, rows, batch_size):
+        with transaction.atomic():
+            posts = []
+            for i in range(start, min(start + batch_size, rows)):
+                begin = now - timedelta(minutes=rnd.randint(0, 60 * 24 * 365 * 5))
+                window = rnd.random()
+                posts.append(
+                    Post(
+                        title="%s %d" % (sentence(rnd, 4), i),
+                        status=Post.STATUS_PUBLISHED if rnd.random() < 0.9 else Post.STATUS_DRAFT,
+                        pub_date_begin=now + timedelta(days=30) if window < 0.025 else begin,
+                        pub_date_end=now - timedelta(days=1) if 0.025 <= window < 0.05 else None,
+                        abstract=sentence(rnd, 30),
+                        text=sentence(rnd, rnd.randint(text_words // 2, text_words * 2)),
+                        is_restricted=rnd.random() < 0.02,
+                    )
+                )
+            posts = Post.objects.bulk_create_posts(posts)
+            PostCategory.objects.bulk_create(
+                PostCategory(post_id=post.pk, category_id=category)
+                for post in posts
+                for category in set(rnd.choices(categories, weights, k=rnd.randint(1, 3)))
+            )
+            PostUser.objects.bulk_create(
+                PostUser(post_id=post.pk, user_id=user.pk) for post in posts if post.is_restricted
+            )
+            PostTranslation.objects.bulk_create(
+                PostTranslation(
+                    post_id=post.pk,
+                    language=language,
+                    title="%s %s" % (language, post.title),
+                    slug="%s-%s" % (language, post.slug),
+                    abstract=sentence(rnd, 30),
+                    text=sentence(rnd, rnd.randint(text_words // 2, text_words * 2)),
+                )
+                for post in posts
+                for language, share in TRANSLATIONS.items()
+                if rnd.random() < share
+            )
+        sys.stderr.write("\r%d/%d posts" % (min(start + batch_size, rows), rows))
+    sys.stderr.write("\n")
+
+
+def run(func, repeat):
+    """
+    Run ``func`` once with cold caches, then ``repeat`` times; then once
+    more tracing the memory allocations.
+    """
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    from posts.lookups import slug_cache
+
+    def timed():
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            func()
+            return time.perf_counter() - start, len(queries)
+
+    cache.clear()
+    slug_cache.clear()
+    cold, cold_queries = timed()
+    times, counts = zip(*[timed() for i in range(repeat)])
+
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "cold_ms": round(cold * 1000, 3),
+        "cold_queries": cold_queries,
+        "median_ms": round(statistics.median(times) * 1000, 3),
+        "min_ms": round(min(times) * 1000, 3),
+        "max_ms": round(max(times) * 1000, 3),
+        "queries": max(counts),
+        "peak_memory_kb": round(peak / 1024, 1),
+    }
+
+
+def get_scenarios(rnd):
+    from django.contrib.auth import get_user_model
+    from django.template.loader import get_template
+    from django.test import Client, RequestFactory
+    from django.utils import translation
+
+    from posts.views import DetailView, ListView, PreviewView
+
+    from .models import Post, PostTranslation
+
+    views = {"post_model": Post, "translation_model": PostTranslation}
+    factory = RequestFactory()
+    published = Post.objects.published().filter(is_restricted=False)
+    count = published.count()
+    post = published.order_by("pk")[rnd.randrange(count)]
+    slug = post.slug
+    translated = PostTranslation.objects.filter(language="it", post__in=published).order_by("pk").first()
+    draft = Post.objects.draft().order_by("pk").first()
+    last_page = max((count - 1) // ListView.paginate_by + 1, 1)
+    client = Client()
+    client.force_login(get_user_model().objects.get(username="admin"))
+
+    def check(response):
+        if response.status_code != 200:
+            raise RuntimeError("unexpected %d response" % response.status_code)
+
+    def view(view_class, path="/", language="en", **kwargs):
+        handler = view_class.as_view(**views)
+
+        def func():
+            with translation.override(language):
+                check(handler(factory.get(path), **kwargs))
+
+        return func
+
+    def tags():
+        with translation.override("it"):
+            get_template("tags.html").render({"params": {"slug": slug}}, factory.get("/"))
+
+    return {
+        "list_view.first_page": view(ListView, "/?page=1"),
+        "list_view.last_page": view(ListView, "/?page=%d" % last_page),
+        "list_view.first_page.it": view(ListView, "/?page=1", language="it"),
+        "list_view.cursor": view(type("CursorListView", (ListView,), {"cursor_paginate": True})),
+        "detail_view.slug": view(DetailView, slug=slug),
+        "detail_view.translated_slug": view(DetailView, language="it", slug=translated.slug if translated else slug),
+        "preview_view": view(PreviewView, "/?token=%s" % draft.get_preview_token(), slug=draft.slug),
+        "tags": tags,
+        "admin.changelist": lambda: check(client.get("/admin/benchmarks/post/")),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", default="1k", help="posts to generate: %s or a number" % ", ".join(SIZES))
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=10, help="timed runs of every scenario")
+    parser.add_argument("--text-words", type=int, default=300, help="average words of the post texts")
+    parser.add_argument("--only", help="comma separated scenarios to run")
+    parser.add_argument("--output", "-o", help="JSON report to write, default to stdout")
+    options = parser.parse_args(argv)
+
+    rows = SIZES[options.rows.lower()] if options.rows.lower() in SIZES else int(options.rows)
+    setup(rows, options.seed)
+    generate(rows, options.seed, options.text_words)
+
+    import django
+
+    scenarios = get_scenarios(random.Random(options.seed))
+    names = options.only.split(",") if options.only else list(scenarios)
+    results = {}
+    for name in names:
+        results[name] = run(scenarios[name], options.repeat)
+        sys.stderr.write("%s: %s\n" % (name, results[name]))
+
+    report = {
+        "meta": {
+            "rows": rows,
+            "seed": options.seed,
+            "repeat": options.repeat,
+            "text_words": options.text_words,
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, "w", encoding="utf-8") as fp:
+            fp.write(output + "\n")
+    else:
+        sys.stdout.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
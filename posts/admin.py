@@ -20,7 +20,9 @@
 
 import django
 from django.conf import settings
-from django.utils.translation import gettext_lazy as _
+from django.contrib.auth import get_user_model
+from django.db.models import Count, Prefetch
+from django.utils.translation import gettext_lazy as _, ngettext
 from fluo import admin, forms
 
 MAX_LANGUAGES = len(settings.LANGUAGES)
@@ -64,8 +66,22 @@ class PostModelAdmin(admin.OrderedModelAdmin):
         [_("Show to"), {"fields": ["users"]}],
     ]
 
+    # show how many users a post is visible to instead of their names,
+    # for sites where posts are restricted to very large sets of users
+    count_users = False
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request).select_related("owner")
+        if self.count_users:
+            return queryset.annotate(users_count=Count("users"))
+        return queryset.prefetch_related(Prefetch("users", queryset=get_user_model().objects.order_by("username")))
+
     def _get_users(self, obj):
-        users = self.users.all().order_by("username")
+        if self.count_users:
+            if obj.users_count:
+                return ngettext("%(count)d user", "%(count)d users", obj.users_count) % {"count": obj.users_count}
+            return _("All")
+        users = obj.users.all()
         if users:
             return ", ".join([user.username for user in users])
         else:
@@ -0,0 +1,162 @@
+# Copyright (C) 2007-2020, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import hashlib
+import math
+
+from django.core.cache import caches
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from . import settings
+
+
+def get_cache():
+    return caches[settings.CACHE]
+
+
+def get_published_key(model):
+    return "posts:published:%s" % model._meta.label_lower
+
+
+def get_published_boundary(queryset, status, now):
+    """
+    The next ``pub_date_begin``/``pub_date_end`` boundary after ``now``, the
+    moment the published set changes without any save happening.
+    """
+    boundaries = queryset.filter(status=status).aggregate(
+        begin=Min("pub_date_begin", filter=Q(pub_date_begin__gt=now)),
+        end=Min("pub_date_end", filter=Q(pub_date_end__gte=now)),
+    )
+    return min((boundary for boundary in boundaries.values() if boundary is not None), default=None)
+
+
+def get_published_timeout(queryset, status, now):
+    """
+    Seconds until the next publication boundary.
+    """
+    boundary = get_published_boundary(queryset, status, now)
+    timeout = settings.PUBLISHED_CACHE_TIMEOUT
+    if boundary is not None:
+        timeout = min(timeout, math.ceil((boundary - now).total_seconds()) + 1)
+    return max(timeout, 1)
+
+
+def get_published_now(model):
+    """
+    The ``now`` of the publication window filter, which stays the same until
+    the published set can change: the next boundary, or a save/delete
+    (see ``invalidate_published``). Querysets filtered with it have the same
+    SQL and parameters on every request, so their rows and the pages built
+    from them can be cached keyed on it.
+    """
+    cache = get_cache()
+    key = get_published_key(model)
+    now = timezone.now()
+    window = cache.get(key)
+    if window is None or (window[1] is not None and now >= window[1]):
+        window = (now, get_published_boundary(model.objects.all(), model.STATUS_PUBLISHED, now))
+        cache.set(key, window, settings.PUBLISHED_CACHE_TIMEOUT)
+    return window[0]
+
+
+def invalidate_published(model):
+    get_cache().delete(get_published_key(model))
+
+
+def get_version_key(model, pk=None):
+    if pk is None:
+        return "posts:version:%s" % model._meta.label_lower
+    return "posts:version:%s:%s" % (model._meta.label_lower, pk)
+
+
+def get_version(model, pk=None):
+    cache = get_cache()
+    key = get_version_key(model, pk)
+    cache.add(key, 1, None)
+    return cache.get(key, 1)
+
+
+def get_versions(model, pks):
+    """
+    ``get_version()`` of many posts at once, as a ``{pk: version}`` dict.
+    """
+    keys = {pk: get_version_key(model, pk) for pk in pks}
+    versions = get_cache().get_many(keys.values())
+    return {pk: versions.get(key, 1) for pk, key in keys.items()}
+
+
+def get_category_key(model, version, name):
+    return "posts:category:%s" % hashlib.md5(repr((model._meta.label_lower, version, name)).encode("utf-8")).hexdigest()
+
+
+def get_category_ids(model, names):
+    """
+    Ids of the ``model`` categories named ``names``, cached by name until a
+    ``model`` category changes. Unknown names are left out.
+    """
+    cache = get_cache()
+    version = get_version(model)
+    keys = {name: get_category_key(model, version, name) for name in names}
+    ids = cache.get_many(keys.values())
+    found = {name: ids[key] for name, key in keys.items() if key in ids}
+    missing = [name for name in keys if name not in found]
+    if missing:
+        resolved = dict(model._base_manager.filter(name__in=missing).values_list("name", "pk"))
+        cache.set_many({keys[name]: pk for name, pk in resolved.items()}, None)
+        found.update(resolved)
+    return list(found.values())
+
+
+def bump_version(model, pk=None):
+    cache = get_cache()
+    key = get_version_key(model, pk)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 2, None)
+
+
+def invalidate_rendered(model, pk=None):
+    """
+    Drop the rendered lists of ``model``, and the rendered ``pk`` post.
+    """
+    bump_version(model)
+    if pk is not None:
+        bump_version(model, pk)
+
+
+def get_render_key(*parts):
+    return "posts:render:%s" % hashlib.md5(repr(parts).encode("utf-8")).hexdigest()
+
+
+def get_etag(*parts):
+    return 'W/"%s"' % hashlib.md5(repr(parts).encode("utf-8")).hexdigest()
+
+
+def invalidate_posts(model, pks=()):
+    """
+    Invalidate everything cached for ``model``, for changes made without
+    the model signals (``update()``, ``bulk_create()``...).
+    """
+    invalidate_published(model)
+    invalidate_rendered(model)
+    for pk in pks:
+        bump_version(model, pk)
@@ -0,0 +1,221 @@
+# Copyright (C) 2007-2020, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import json
+from io import StringIO
+
+from django.contrib.syndication.views import Feed
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import translation
+from django.utils.cache import get_conditional_response
+from django.utils.feedgenerator import Atom1Feed, Rss201rev2Feed, SyndicationFeed
+from django.utils.http import http_date
+from django.utils.translation import get_language
+from django.utils.xmlutils import SimplerXMLGenerator
+
+from . import settings
+from .cache import get_cache, get_etag, get_render_key, get_version, get_versions
+from .renderers import get_renderer
+
+
+class CachedItemsMixin:
+    """
+    Feed generator mixin writing every item from its serialized fragment:
+    items carrying a ``fragment`` are written as is, the others are
+    serialized and stored under their ``cache_key``.
+    """
+
+    def render_item(self, item):
+        raise NotImplementedError
+
+    def get_fragments(self):
+        fragments, missing = [], {}
+        for item in self.items:
+            fragment = item.get("fragment")
+            if fragment is None:
+                fragment = self.render_item(item)
+                if item.get("cache_key"):
+                    missing[item["cache_key"]] = fragment
+            fragments.append(fragment)
+        if missing:
+            get_cache().set_many(missing, settings.FEED_CACHE_TIMEOUT)
+        return fragments
+
+
+class CachedXMLItemsMixin(CachedItemsMixin):
+    def render_item(self, item):
+        out = StringIO()
+        items, self.items = self.items, [item]
+        try:
+            super().write_items(SimplerXMLGenerator(out, "utf-8", short_empty_elements=True))
+        finally:
+            self.items = items
+        return out.getvalue()
+
+    def write_items(self, handler):
+        for fragment in self.get_fragments():
+            # written verbatim, the fragment is already escaped
+            handler.ignorableWhitespace(fragment)
+
+
+class CachedRssFeed(CachedXMLItemsMixin, Rss201rev2Feed):
+    pass
+
+
+class CachedAtomFeed(CachedXMLItemsMixin, Atom1Feed):
+    pass
+
+
+class JSONFeed(CachedItemsMixin, SyndicationFeed):
+    """
+    JSON Feed 1.1 (https://jsonfeed.org/version/1.1).
+    """
+
+    content_type = "application/feed+json; charset=utf-8"
+
+    def render_item(self, item):
+        data = {
+            "id": item["unique_id"] or item["link"],
+            "url": item["link"],
+            "title": item["title"],
+            "content_html": item["description"],
+            "date_published": item["pubdate"],
+            "date_modified": item["updateddate"],
+            "tags": item["categories"] or None,
+        }
+        if item["author_name"]:
+            data["authors"] = [{"name": item["author_name"], "url": item["author_link"]}]
+        return json.dumps({key: value for key, value in data.items() if value}, cls=DjangoJSONEncoder)
+
+    def write(self, outfile, encoding):
+        data = {
+            "version": "https://jsonfeed.org/version/1.1",
+            "title": self.feed["title"],
+            "home_page_url": self.feed["link"],
+            "feed_url": self.feed["feed_url"],
+            "description": self.feed["description"],
+            "language": self.feed["language"],
+        }
+        head = json.dumps({key: value for key, value in data.items() if value}, cls=DjangoJSONEncoder)
+        outfile.write('%s,"items":[%s]}' % (head[:-1], ",".join(self.get_fragments())))
+
+
+class PostFeed(Feed):
+    """
+    Feed of the latest published posts, in the active language or in the
+    ``language`` given by the url.
+
+    Items are serialized once per post version and put together from the
+    cache; requests carrying the current ``ETag``/``Last-Modified`` are
+    answered with a 304 after a single query.
+    """
+
+    feed_type = CachedRssFeed
+    post_model = None
+    translation_model = None
+    limit = 25
+
+    def __call__(self, request, *args, language=None, **kwargs):
+        with translation.override(language or get_language()):
+            etag, last_modified = self.get_validators(request)
+            timestamp = None if last_modified is None else int(last_modified.timestamp())
+            response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+            if response is None:
+                response = super().__call__(request, *args, **kwargs)
+            response["ETag"] = etag
+            if last_modified is not None:
+                response["Last-Modified"] = http_date(timestamp)
+            return response
+
+    def get_object(self, request, *args, **kwargs):
+        return request
+
+    def get_queryset(self, request):
+        queryset = self.post_model.objects.cached_published().visible_to(None).order_by("-pub_date_begin", "-pk")
+        return queryset[: self.limit]
+
+    def get_item_key(self, request, post, version):
+        return get_render_key(
+            "feed",
+            self.feed_type.__name__,
+            request.get_host(),
+            request.is_secure(),
+            post._meta.label_lower,
+            post.pk,
+            post.last_modified_at,
+            get_language(),
+            version,
+        )
+
+    def get_validators(self, request):
+        rows = list(self.get_queryset(request).values_list("pk", "last_modified_at"))
+        last_modified = max(modified for pk, modified in rows) if rows else None
+        etag = get_etag(
+            "feed", self.feed_type.__name__, request.get_host(), get_language(), rows, get_version(self.post_model)
+        )
+        return etag, last_modified
+
+    def items(self, request):
+        queryset = self.get_queryset(request)
+        if self.translation_model is not None:
+            queryset = queryset.with_translation()
+        posts = list(queryset)
+        versions = get_versions(self.post_model, [post.pk for post in posts])
+        keys = {post.pk: self.get_item_key(request, post, versions[post.pk]) for post in posts}
+        fragments = get_cache().get_many(keys.values())
+        for post in posts:
+            post.feed_key = keys[post.pk]
+            post.feed_fragment = fragments.get(post.feed_key)
+        return posts
+
+    def item_extra_kwargs(self, item):
+        return {"cache_key": item.feed_key, "fragment": item.feed_fragment}
+
+    def item_title(self, item):
+        return item.translate().title
+
+    def item_description(self, item):
+        if item.feed_fragment is not None:
+            # the description is already in the cached item
+            return ""
+        post = item.translate()
+        if getattr(post, "abstract_html", None):
+            return post.abstract_html
+        return get_renderer()(post.abstract or post.text)
+
+    def item_pubdate(self, item):
+        return item.pub_date_begin
+
+    def item_updateddate(self, item):
+        return item.last_modified_at
+
+    def item_guid(self, item):
+        return "urn:uuid:%s" % item.uuid
+
+    def item_guid_is_permalink(self, item):
+        return False
+
+
+class AtomPostFeed(PostFeed):
+    feed_type = CachedAtomFeed
+
+
+class JSONPostFeed(PostFeed):
+    feed_type = JSONFeed
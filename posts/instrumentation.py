@@ -0,0 +1,121 @@
+# Copyright (C) 2007-2020, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import functools
+import time
+from collections import namedtuple
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings as django_settings
+from django.db import connections
+from django.utils.module_loading import import_string
+
+from . import settings
+from .signals import measured
+
+# ``name`` is the measured method (e.g. "ListView.get"), ``label`` the view
+# class or the tag name; times are in seconds
+Metric = namedtuple("Metric", ["name", "label", "queries", "query_time", "duration"])
+
+
+class QueryCounter:
+    """
+    ``connection.execute_wrapper()`` counting the queries and their time.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.query_time += time.perf_counter() - start
+
+
+@functools.lru_cache(maxsize=None)
+def get_callback():
+    return import_string(settings.METRICS_CALLBACK) if settings.METRICS_CALLBACK else None
+
+
+def get_request_metrics(request):
+    return request.__dict__.setdefault("_posts_metrics", [])
+
+
+def report(metric, request=None):
+    measured.send(sender=Metric, metric=metric, request=request)
+    callback = get_callback()
+    if callback is not None:
+        callback(metric)
+    if request is not None and django_settings.DEBUG:
+        get_request_metrics(request).append(metric)
+
+
+@contextmanager
+def measure(name, label, request=None):
+    """
+    Count the queries run, on every database, and time the block; then
+    send ``posts.signals.measured``, call ``POSTS_METRICS_CALLBACK`` and,
+    with ``DEBUG``, add the metric to the ``posts_metrics`` of ``request``.
+    """
+    counter = QueryCounter()
+    start = time.perf_counter()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(counter))
+        try:
+            yield counter
+        finally:
+            duration = time.perf_counter() - start
+    report(Metric(name, label, counter.queries, counter.query_time, duration), request)
+
+
+def instrument(method):
+    """
+    Measure ``method`` of a view (labelled by the view class) or of a
+    template node (labelled by its ``tag_name``) when
+    ``POSTS_INSTRUMENTATION`` is on.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not settings.INSTRUMENTATION:
+            return method(self, *args, **kwargs)
+        if hasattr(self, "tag_name"):
+            label, request = self.tag_name, args[0].get("request")
+        else:
+            label, request = type(self).__name__, args[0]
+        with measure(method.__qualname__, label, request):
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+def metrics(request):
+    """
+    Context processor adding ``posts_metrics``, the metrics measured so far
+    while serving ``request``; the list keeps growing while the page renders.
+    """
+    if not settings.INSTRUMENTATION or not django_settings.DEBUG:
+        return {}
+    return {"posts_metrics": get_request_metrics(request)}
@@ -0,0 +1,174 @@
+# Copyright (C) 2007-2020, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import threading
+from collections import OrderedDict
+
+from django.utils.translation import get_language
+
+from . import settings
+
+
+class LRUCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                self.data.move_to_end(key)
+            except KeyError:
+                return default
+            return self.data[key]
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+# slug -> (pk, found through a translation), shared by every post model in
+# the process; entries are always verified against the database
+slug_cache = LRUCache(settings.SLUG_CACHE_SIZE)
+
+
+def _does_not_exist(model, slug):
+    return model.DoesNotExist("%s matching slug %r does not exist." % (model._meta.object_name, slug))
+
+
+def _filter_translation_slug(queryset, translation_model, slug):
+    return queryset.filter(pk__in=translation_model.objects.filter(slug=slug).values("post"))
+
+
+def get_post_by_slug(queryset, slug, translation_model=None):
+    """
+    Return the post of ``queryset`` whose slug, or one of its translations
+    slug, is ``slug``.
+
+    Slugs are always stored lowercase by ``save()``, so the lookups are exact
+    and use the slug indexes: first the post slug, then the translations slug.
+    A hit is remembered in ``slug_cache`` so the next request is a single
+    lookup by pk.
+    """
+    model = queryset.model
+    slug = slug.lower()
+    key = (model._meta.label_lower, slug)
+
+    cached = slug_cache.get(key)
+    if cached is not None:
+        pk, translated = cached
+        if translated:
+            post = _filter_translation_slug(queryset.filter(pk=pk), translation_model, slug).first()
+        else:
+            post = queryset.filter(pk=pk, slug=slug).first()
+        if post is not None:
+            return post
+        slug_cache.delete(key)
+
+    post, translated = queryset.filter(slug=slug).first(), False
+    if post is None and translation_model is not None:
+        post, translated = _filter_translation_slug(queryset, translation_model, slug).first(), True
+    if post is None:
+        raise _does_not_exist(model, slug)
+
+    slug_cache.set(key, (post.pk, translated))
+    return post
+
+
+async def aget_post_by_slug(queryset, slug, translation_model=None):
+    """
+    ``get_post_by_slug()`` with the async ORM.
+    """
+    model = queryset.model
+    slug = slug.lower()
+    key = (model._meta.label_lower, slug)
+
+    cached = slug_cache.get(key)
+    if cached is not None:
+        pk, translated = cached
+        if translated:
+            post = await _filter_translation_slug(queryset.filter(pk=pk), translation_model, slug).afirst()
+        else:
+            post = await queryset.filter(pk=pk, slug=slug).afirst()
+        if post is not None:
+            return post
+        slug_cache.delete(key)
+
+    post, translated = await queryset.filter(slug=slug).afirst(), False
+    if post is None and translation_model is not None:
+        post, translated = await _filter_translation_slug(queryset, translation_model, slug).afirst(), True
+    if post is None:
+        raise _does_not_exist(model, slug)
+
+    slug_cache.set(key, (post.pk, translated))
+    return post
+
+
+def get_post(request, queryset, slug, translation_model=None):
+    """
+    Shared by ``DetailView`` and ``{% get_posts %}``: resolve ``slug`` with
+    ``get_post_by_slug`` joining the active language translation, and
+    memoize the post on ``request`` by model, slug and language, so the same
+    post is fetched once per request.
+    """
+    language = get_language()
+    key = (queryset.model._meta.label_lower, slug.lower(), language)
+    memo = request.__dict__.setdefault("_posts_memo", {}) if request is not None else {}
+    if key not in memo:
+        if translation_model is not None:
+            queryset = queryset.with_translation(language)
+        try:
+            memo[key] = get_post_by_slug(queryset, slug, translation_model)
+        except queryset.model.DoesNotExist:
+            memo[key] = None
+    if memo[key] is None:
+        raise _does_not_exist(queryset.model, slug)
+    return memo[key]
+
+
+async def aget_post(request, queryset, slug, translation_model=None):
+    """
+    ``get_post()`` with the async ORM, sharing the same request memo.
+    """
+    language = get_language()
+    key = (queryset.model._meta.label_lower, slug.lower(), language)
+    memo = request.__dict__.setdefault("_posts_memo", {}) if request is not None else {}
+    if key not in memo:
+        if translation_model is not None:
+            queryset = queryset.with_translation(language)
+        try:
+            memo[key] = await aget_post_by_slug(queryset, slug, translation_model)
+        except queryset.model.DoesNotExist:
+            memo[key] = None
+    if memo[key] is None:
+        raise _does_not_exist(queryset.model, slug)
+    return memo[key]
@@ -0,0 +1,74 @@
+# Copyright (C) 2007-2020, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import os
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from ...sitemaps import get_sitemaps, write_index, write_urlset
+
+
+class Command(BaseCommand):
+    help = "Write the post sitemaps, split in files of at most --limit urls, and their sitemap.xml index."
+
+    def add_arguments(self, parser):
+        parser.add_argument("model", help="app_label.ModelName of the post model")
+        parser.add_argument("--translations", help="app_label.ModelName of the translation model")
+        parser.add_argument("--url-name", help="url name of the post detail, reversed with the slug kwarg")
+        parser.add_argument("--base-url", required=True, help="site url, e.g. https://example.com")
+        parser.add_argument("--output", "-o", required=True, help="directory to write the sitemaps to")
+        parser.add_argument("--limit", type=int, default=50000, help="urls per sitemap file")
+
+    def write(self, path, writer, *args):
+        # write aside and move in place, so the sitemap served is never half written
+        with open(path + ".tmp", "w", encoding="utf-8") as outfile:
+            writer(outfile, *args)
+        os.replace(path + ".tmp", path)
+
+    def handle(self, *args, **options):
+        try:
+            post_model = apps.get_model(options["model"])
+            translation_model = apps.get_model(options["translations"]) if options["translations"] else None
+        except (LookupError, ValueError) as err:
+            raise CommandError(str(err))
+        base_url = urlsplit(options["base_url"])
+        if not base_url.scheme or not base_url.netloc:
+            raise CommandError("invalid --base-url %r" % options["base_url"])
+        site = SimpleNamespace(domain=base_url.netloc)
+        os.makedirs(options["output"], exist_ok=True)
+
+        index = []
+        for section, sitemap in get_sitemaps(post_model, translation_model, options["url_name"]).items():
+            sitemap.limit = options["limit"]
+            count = 0
+            for page in sitemap.paginator.page_range:
+                urls = sitemap.get_urls(page=page, site=site, protocol=base_url.scheme)
+                filename = "sitemap-%s-%d.xml" % (section, page)
+                self.write(os.path.join(options["output"], filename), write_urlset, urls)
+                lastmod = max((url["lastmod"] for url in urls), default=None)
+                index.append(("%s/%s" % (options["base_url"].rstrip("/"), filename), lastmod))
+                count += len(urls)
+            self.stdout.write("%s: %d urls" % (section, count))
+
+        self.write(os.path.join(options["output"], "sitemap.xml"), write_index, index)
+        self.stdout.write("%d sitemaps written" % len(index))
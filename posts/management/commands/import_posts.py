@@ -0,0 +1,75 @@
+# Copyright (C) 2007-2020, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import sys
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+
+from ...transfer import Importer
+
+
+class Command(BaseCommand):
+    help = "Upsert posts and their translations from the NDJSON written by export_posts, in constant memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument("model", help="app_label.ModelName of the post model")
+        parser.add_argument("--translations", help="app_label.ModelName of the translation model")
+        parser.add_argument("--input", "-i", help="file to read, default to stdin")
+        parser.add_argument("--key", choices=["uuid", "slug"], default="uuid", help="field matching existing posts")
+        parser.add_argument("--batch-size", type=int, default=1000, help="rows written at once")
+
+    def handle(self, *args, **options):
+        try:
+            post_model = apps.get_model(options["model"])
+            translation_model = apps.get_model(options["translations"]) if options["translations"] else None
+        except (LookupError, ValueError) as err:
+            raise CommandError(str(err))
+
+        start = time.monotonic()
+        total = [0]
+
+        def progress(importer, count):
+            total[0] += count
+            elapsed = time.monotonic() - start
+            self.stderr.write(
+                "%d rows (%d created, %d updated, %d errors), %.0f rows/s"
+                % (total[0], importer.created, importer.updated, len(importer.errors), total[0] / (elapsed or 1))
+            )
+
+        importer = Importer(
+            post_model, translation_model, key=options["key"], batch_size=options["batch_size"], on_flush=progress
+        )
+        stream = open(options["input"], encoding="utf-8") if options["input"] else sys.stdin
+        try:
+            for lineno, line in enumerate(stream, 1):
+                if line.strip():
+                    importer.add(line, lineno)
+            importer.flush()
+        except DatabaseError as err:
+            raise CommandError("import aborted: %s" % err)
+        finally:
+            if options["input"]:
+                stream.close()
+
+        for lineno, err in importer.errors:
+            self.stderr.write("line %s: %s" % (lineno or "-", err))
@@ -0,0 +1,86 @@
+# Copyright (C) 2007-2020, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from ... import settings
+from ...cache import get_cache, get_published_now, invalidate_posts
+from ...models import PostModel
+
+
+class Command(BaseCommand):
+    help = (
+        "Process the posts which entered or left their publication window since the last run: "
+        "invalidate their cached pages and compute the publication window again, so requests don't have to."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("models", nargs="+", help="app_label.ModelName of the post models to process")
+        parser.add_argument("--since", help="ISO datetime to start from, instead of the last run")
+        parser.add_argument("--batch-size", type=int, default=1000, help="posts invalidated at once")
+
+    def handle(self, *args, **options):
+        cache = get_cache()
+        now = timezone.now()
+        since = None
+        if options["since"]:
+            since = parse_datetime(options["since"])
+            if since is None:
+                raise CommandError("invalid --since datetime %r" % options["since"])
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+
+        for label in options["models"]:
+            try:
+                model = apps.get_model(label)
+            except (LookupError, ValueError) as err:
+                raise CommandError(str(err))
+            if not issubclass(model, PostModel):
+                raise CommandError("%s is not a post model" % label)
+
+            key = "posts:scheduled:%s" % model._meta.label_lower
+            begin = since or cache.get(key) or now - timedelta(seconds=settings.PUBLISHED_CACHE_TIMEOUT)
+            began = Q(pub_date_begin__gt=begin, pub_date_begin__lte=now)
+            ended = Q(pub_date_end__gte=begin, pub_date_end__lt=now)
+            queryset = (
+                model._base_manager.filter(status=model.STATUS_PUBLISHED)
+                .filter(began | ended)
+                .order_by("pk")
+                .values_list("pk", flat=True)
+            )
+
+            count, last = 0, None
+            while True:
+                batch = list((queryset if last is None else queryset.filter(pk__gt=last))[: options["batch_size"]])
+                if not batch:
+                    break
+                invalidate_posts(model, batch)
+                count, last = count + len(batch), batch[-1]
+
+            invalidate_posts(model)
+            get_published_now(model)
+            cache.set(key, now, None)
+            self.stdout.write("%s: %d posts entered or left publication since %s" % (label, count, begin.isoformat()))
@@ -0,0 +1,43 @@
+# Copyright (C) 2007-2020, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from ...search import rebuild
+
+
+class Command(BaseCommand):
+    help = "Rebuild the search index (FTS5 table or search_vector column) of posts and translations."
+
+    def add_arguments(self, parser):
+        parser.add_argument("model", help="app_label.ModelName of the post model")
+        parser.add_argument("--translations", help="app_label.ModelName of the translation model")
+        parser.add_argument("--batch-size", type=int, default=1000, help="rows loaded at once")
+
+    def handle(self, *args, **options):
+        try:
+            post_model = apps.get_model(options["model"])
+            translation_model = apps.get_model(options["translations"]) if options["translations"] else None
+        except (LookupError, ValueError) as err:
+            raise CommandError(str(err))
+
+        for count in rebuild(post_model, translation_model, batch_size=options["batch_size"]):
+            self.stdout.write("%d rows indexed" % count)
@@ -0,0 +1,54 @@
+# Copyright (C) 2007-2020, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import RenderedModel
+
+
+class Command(BaseCommand):
+    help = "Fill the rendered abstract, text and excerpt of existing posts and translations."
+
+    def add_arguments(self, parser):
+        parser.add_argument("models", nargs="+", help="app_label.ModelName of the models to render")
+        parser.add_argument("--batch-size", type=int, default=500, help="rows rendered and saved at once")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        for label in options["models"]:
+            try:
+                model = apps.get_model(label)
+            except (LookupError, ValueError) as err:
+                raise CommandError(str(err))
+            if not issubclass(model, RenderedModel):
+                raise CommandError("%s does not inherit from posts.models.RenderedModel" % label)
+
+            queryset = model._base_manager.order_by("pk").only("pk", "abstract", "text")
+            count, last = 0, None
+            while True:
+                batch = list((queryset if last is None else queryset.filter(pk__gt=last))[:batch_size])
+                if not batch:
+                    break
+                for obj in batch:
+                    obj.render_body()
+                model._base_manager.bulk_update(batch, model.RENDERED_FIELDS)
+                count, last = count + len(batch), batch[-1].pk
+                self.stdout.write("%s: %d rendered" % (label, count))
@@ -18,25 +18,342 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+from datetime import datetime, timezone as dt_timezone
+from functools import partial
 from uuid import uuid1
 
 from django.conf import settings
+from django.db import transaction
+from django.db.backends.utils import names_digest
+from django.db.models.functions import Coalesce, Lag, Lead
+from django.db.models.query import ModelIterable, ValuesIterable
+from django.db.models.signals import class_prepared
+from django.dispatch import receiver
 from django.utils import timezone
+from django.utils.functional import cached_property
 from django.utils.text import slugify
-from django.utils.translation import gettext_lazy as _
+from django.utils.translation import get_language, gettext_lazy as _
 from fluo.db import models
-from fluo.db.models import Q
+from fluo.db.models import Exists, FilteredRelation, OuterRef, Q, Subquery
+from fluo.db.models.models import I18NProxy
+
+from .cache import get_category_ids, get_published_now, invalidate_posts
+from .preview import make_token
+from .renderers import get_excerpt, get_renderer
+from .search import index_all
+
+# sentinels used instead of NULL when ``normalize_publication_dates`` is on
+PUBLICATION_DATE_MIN = datetime(1900, 1, 1, tzinfo=dt_timezone.utc if settings.USE_TZ else None)
+PUBLICATION_DATE_MAX = datetime(9999, 1, 1, tzinfo=dt_timezone.utc if settings.USE_TZ else None)
+
+
+def get_restricted(model):
+    """
+    Expression telling if a post of ``model`` is visible only to some users.
+    """
+    field = model._meta.get_field("users")
+    through = field.remote_field.through
+    return Exists(through._base_manager.filter(**{field.m2m_field_name(): OuterRef("pk")}))
+
+
+def load_deferred(instance, fields, using=None):
+    """
+    Load the deferred ``fields`` of ``instance`` and of every instance
+    fetched in the same list still missing them, with one query.
+    Return False when ``instance`` was not fetched in a list.
+    """
+    peers = getattr(instance, "_list_peers", None)
+    if not peers:
+        return False
+    pending = [peer for peer in peers if set(fields) & peer.get_deferred_fields()]
+    manager = type(instance)._base_manager.using(using or instance._state.db)
+    rows = {row[0]: row[1:] for row in manager.filter(pk__in=[peer.pk for peer in pending]).values_list("pk", *fields)}
+    if instance.pk not in rows:
+        return False
+    for peer in pending:
+        if peer.pk in rows:
+            for name, value in zip(fields, rows[peer.pk]):
+                setattr(peer, name, value)
+    return True
+
+
+class DeferredFieldError(Exception):
+    """
+    A field not selected in ``PostModelQuerySet.rows()`` was accessed. It is
+    not an ``AttributeError``, so that templates do not silence it.
+    """
+
+
+class PostRow:
+    """
+    Read only row of ``PostModelQuerySet.rows()``, holding only the
+    selected fields.
+    """
+
+    __slots__ = ["_values"]
+
+    def __init__(self, values):
+        object.__setattr__(self, "_values", values)
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        try:
+            return self._values[name]
+        except KeyError:
+            raise DeferredFieldError("%r is not selected in this post list" % name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("post rows are read only")
+
+    def __repr__(self):
+        return "<PostRow: %s>" % self._values.get("pk")
+
+    def __reduce__(self):
+        # rows are read only, pickle them through __init__
+        return (PostRow, (self._values,))
+
+    def translate(self, language=None):
+        """
+        The row with the fields of the translations joined by
+        ``with_translation()``, as ``PostModel.translate()`` does.
+        """
+        values = dict(self._values)
+        for prefix in ["default_translation__", "active_translation__"]:
+            for name, value in self._values.items():
+                if name.startswith(prefix) and value:
+                    values[name[len(prefix):]] = value
+        return PostRow(values)
+
+
+class PostRowIterable(ValuesIterable):
+    def __iter__(self):
+        for values in super().__iter__():
+            yield PostRow(values)
 
 
 class PostModelQuerySet(models.QuerySet):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._with_neighbours = False
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._with_neighbours = self._with_neighbours
+        return clone
+
+    def _fetch_all(self):
+        fetched = self._result_cache is None
+        super()._fetch_all()
+        if fetched and self._with_neighbours:
+            self._fill_neighbours(self._result_cache)
+        if fetched and self._iterable_class is ModelIterable and self.query.deferred_loading[0]:
+            self._set_list_peers(self._result_cache)
+
+    def _set_list_peers(self, posts):
+        # a deferred field accessed on a post is loaded for the whole list
+        # at once, see load_deferred()
+        posts = [post for post in posts if isinstance(post, PostModel)]
+        for post in posts:
+            post._list_peers = posts
+        for relation in self.query._filtered_relations:
+            translations = [getattr(post, relation) for post in posts if getattr(post, relation, None) is not None]
+            for translation in translations:
+                translation._list_peers = translations
+
+    def _fill_neighbours(self, posts):
+        posts = [post for post in posts if isinstance(post, PostModel)]
+        pks = {pk for post in posts for pk in (post.next_pk, post.prev_pk) if pk is not None}
+        neighbours = self.model._default_manager.in_bulk(pks) if pks else {}
+        for post in posts:
+            post.__dict__["next"] = neighbours.get(post.next_pk)
+            post.__dict__["prev"] = neighbours.get(post.prev_pk)
+
+    def with_neighbours(self):
+        """
+        Annotate every post with ``next_pk`` and ``prev_pk`` (LEAD/LAG over
+        ``pub_date_begin``, inside this queryset) and prefill ``next`` and
+        ``prev`` with a single extra query for the whole result.
+        """
+        order_by = [models.F("pub_date_begin").asc(), models.F("pk").asc()]
+        clone = self.annotate(
+            next_pk=models.Window(expression=Lead("pk"), order_by=order_by),
+            prev_pk=models.Window(expression=Lag("pk"), order_by=order_by),
+        )
+        clone._with_neighbours = True
+        return clone
+
+    def with_translation(self, language=None):
+        """
+        Join the ``language`` (default: active language) translation, and the
+        default language one to fall back to, in the same query, so that
+        ``post.translate()`` does not hit the database. As in fluo, the
+        translation language only has to start with the two letter code
+        (``pt`` matches ``pt-br``); when several do, the one matching the
+        full code is joined, so every post is still a single row.
+        """
+        full = language or get_language() or ""
+        language = full[:2]
+        default = settings.LANGUAGE_CODE[:2]
+        related = {"active_translation": (language, full)}
+        if default != language:
+            related["default_translation"] = (default, settings.LANGUAGE_CODE)
+        return self.annotate(
+            active_language=models.Value(language, output_field=models.CharField()),
+            **{
+                name: FilteredRelation(
+                    "translations", condition=Q(translations__pk=self._get_translation_pk(code, full_code))
+                )
+                for name, (code, full_code) in related.items()
+            },
+        ).select_related(*related)
+
+    def _get_translation_pk(self, code, full_code):
+        translation_model = self.model._meta.get_field("translations").related_model
+        preference = models.Case(
+            models.When(language__iexact=full_code, then=0), models.When(language=code, then=1), default=2
+        )
+        translations = translation_model._base_manager.filter(post=OuterRef("pk"), language__startswith=code)
+        return Subquery(translations.order_by(preference, "language", "pk").values("pk")[:1])
+
+    def _get_translation_relations(self):
+        if "translations" not in [field.name for field in self.model._meta.get_fields()]:
+            return None, []
+        return self.model._meta.get_field("translations").related_model, list(self.query._filtered_relations)
+
+    def for_list(self, only=None, defer=None):
+        """
+        Defer the fields list pages don't need: the ``list_deferred_fields``
+        of the post (and of the joined translations), or ``defer``, or all
+        but ``only``. A deferred field accessed later is loaded for the
+        whole list with one query.
+        """
+        if only is not None:
+            only = set(only) | {"pk"}
+            deferred = [field.name for field in self.model._meta.concrete_fields if field.name not in only]
+            deferred = [name for name in deferred if name != self.model._meta.pk.name]
+        else:
+            deferred = self.model.list_deferred_fields if defer is None else defer
+        translation_model, relations = self._get_translation_relations()
+        names = {field.name for field in self.model._meta.concrete_fields}
+        fields = [name for name in deferred if name in names]
+        if translation_model is not None:
+            names = {field.name for field in translation_model._meta.concrete_fields}
+            translated = translation_model.list_deferred_fields if only is None and defer is None else deferred
+            fields += ["%s__%s" % (relation, name) for relation in relations for name in translated if name in names]
+        return self.defer(*fields) if fields else self
+
+    def rows(self, *fields):
+        """
+        Read only ``PostRow`` objects holding only ``fields`` (and the
+        ``row_fields`` of the post model), plus the same fields of the
+        translations joined by ``with_translation()``, fetched with
+        ``values()``. Accessing any other field raises ``DeferredFieldError``.
+        """
+        fields = list(dict.fromkeys([*self.model.row_fields, self.model._meta.pk.attname, *fields]))
+        translation_model, relations = self._get_translation_relations()
+        if translation_model is not None:
+            names = {field.name for field in translation_model._meta.concrete_fields}
+            fields += ["%s__%s" % (relation, name) for relation in relations for name in fields if name in names]
+        clone = self.values(*fields)
+        clone._iterable_class = PostRowIterable
+        return clone
+
+    def visible_to(self, user):
+        """
+        Posts without ``users`` and, for an authenticated user, the posts
+        restricted to them. Public posts are told apart by ``is_restricted``,
+        so anonymous users never touch the ``users`` table.
+        """
+        if user is None or not user.is_authenticated:
+            return self.filter(is_restricted=False)
+        field = self.model._meta.get_field("users")
+        through = field.remote_field.through
+        allowed = through._base_manager.filter(
+            **{field.m2m_field_name(): OuterRef("pk"), field.m2m_reverse_field_name(): user.pk}
+        )
+        return self.filter(Q(is_restricted=False) | Q(Exists(allowed)))
+
+    def in_categories(self, names, match_all=False):
+        """
+        Posts in any (with ``match_all``, in every) of the categories named
+        ``names``, filtered with ``EXISTS`` on the m2m table instead of a
+        join, so there are no duplicate rows to remove with ``DISTINCT``.
+        """
+        field = self.model._meta.get_field("categories")
+        ids = get_category_ids(field.related_model, names)
+        if not ids or (match_all and len(ids) < len(set(names))):
+            return self.none()
+        through = field.remote_field.through._base_manager.filter(**{field.m2m_field_name(): OuterRef("pk")})
+        category = field.m2m_reverse_field_name()
+        if match_all:
+            return self.filter(*[Exists(through.filter(**{category: pk})) for pk in ids])
+        return self.filter(Exists(through.filter(**{"%s__in" % category: ids})))
+
+    def update_restricted(self):
+        return self.update(is_restricted=get_restricted(self.model))
+
+    def bulk_create_posts(self, posts, batch_size=None):
+        """
+        ``bulk_create()`` applying the defaults of ``PostModel.save()``
+        (slug, uuid, dates, ordering and, for ``RenderedModel``, the rendered
+        fields) in Python.
+        """
+        now = timezone.now()
+        ordering = self.model._default_manager.aggregate(max=models.Max("ordering"))["max"] or 0
+        for post in posts:
+            post.set_defaults(now)
+            if isinstance(post, RenderedModel):
+                post.render_body()
+            if not post.ordering:
+                ordering += 1
+                post.ordering = ordering
+        posts = self.bulk_create(posts, batch_size=batch_size)
+        transaction.on_commit(partial(invalidate_posts, self.model))
+        # bulk_create() sets the pks only on some backends, the uuids are always set
+        uuids = [post.uuid for post in posts]
+        for start in range(0, len(uuids), 500):
+            queryset = self.model._base_manager.using(self.db).filter(uuid__in=uuids[start:start + 500])
+            transaction.on_commit(partial(index_all, queryset))
+        return posts
+
+    def bulk_publish(self, batch_size=500):
+        """
+        Publish the posts of this queryset with one UPDATE per batch, filling
+        ``event_date`` and ``pub_date_begin`` like ``PostModel.save()``.
+        """
+        now = models.Value(timezone.now(), output_field=models.DateTimeField())
+        pks = list(self.values_list("pk", flat=True))
+        for start in range(0, len(pks), batch_size):
+            self.model._base_manager.filter(pk__in=pks[start:start + batch_size]).update(
+                status=PostModel.STATUS_PUBLISHED,
+                event_date=Coalesce("event_date", now),
+                pub_date_begin=models.Case(
+                    models.When(Q(pub_date_begin__isnull=True) | Q(pub_date_begin=PUBLICATION_DATE_MIN), then=now),
+                    default=models.F("pub_date_begin"),
+                ),
+                last_modified_at=now,
+            )
+        transaction.on_commit(partial(invalidate_posts, self.model, pks))
+        return len(pks)
+
     def draft(self):
         return self._filter(status=PostModel.STATUS_DRAFT)
 
     def published(self):
         return self._filter(status=PostModel.STATUS_PUBLISHED)
 
-    def _filter(self, status):
-        now = timezone.now()
+    def cached_published(self):
+        """
+        Same rows as ``published()``, filtered with the cached
+        ``get_published_now()`` instead of the current time.
+        """
+        return self._filter(status=PostModel.STATUS_PUBLISHED, now=get_published_now(self.model))
+
+    def _filter(self, status, now=None):
+        now = timezone.now() if now is None else now
+        if self.model.normalize_publication_dates:
+            return self.filter(status=status, pub_date_begin__lte=now, pub_date_end__gte=now)
         q1 = Q(Q(pub_date_begin__isnull=True) | Q(pub_date_begin__lte=now))
         q2 = Q(Q(pub_date_end__isnull=True) | Q(pub_date_end__gte=now))
         return self.filter(status=status).filter(q1 & q2)
@@ -56,8 +373,17 @@ class PostModel(models.TimestampModel, models.OrderedModel, models.I18NModel):
 
     objects = PostModelManager()
 
+    # store PUBLICATION_DATE_MIN/PUBLICATION_DATE_MAX instead of NULL in
+    # pub_date_begin/pub_date_end, so that the publication filter is a
+    # plain range scan (see posts.operations.NormalizePublicationDates)
+    normalize_publication_dates = False
+    # fields left out of list pages by ``for_list()``
+    list_deferred_fields = ["text", "note"]
+    # fields always selected by ``rows()``
+    row_fields = ["pk", "slug", "pub_date_begin", "last_modified_at", "is_restricted"]
+
     uuid = models.StringField(
-        max_length=36, blank=True, verbose_name=_("uuid field"), help_text=_("for preview."),
+        max_length=36, blank=True, db_index=True, verbose_name=_("uuid field"), help_text=_("for preview."),
     )
     status = models.StatusField(
         choices=STATUS_CHOICES, default=STATUS_DRAFT, help_text=_("If should be displayed or not."),
@@ -78,6 +404,8 @@ class PostModel(models.TimestampModel, models.OrderedModel, models.I18NModel):
         verbose_name=_("Visible only to"),
         help_text=_("Post visible to these users, if empty is visible to all users."),
     )
+    # denormalized "users is not empty", kept in sync on m2m_changed
+    is_restricted = models.BooleanField(default=False, editable=False, verbose_name=_("Restricted"))
     event_date = models.DateTimeField(
         blank=True, null=True, verbose_name=_("Post date"), help_text=_("Date which post refers to."),
     )
@@ -101,47 +429,149 @@ class PostModel(models.TimestampModel, models.OrderedModel, models.I18NModel):
     class Meta:
         abstract = True
         unique_together = [("title", "slug")]
+        # inherited only by a concrete model whose Meta subclasses
+        # PostModel.Meta, see posts.operations.NormalizePublicationDates
+        indexes = [
+            models.Index(fields=["status", "pub_date_begin", "pub_date_end"]),
+            models.Index(
+                fields=["pub_date_begin", "pub_date_end"],
+                name="%(app_label)s_%(class)s_pub",
+                condition=Q(status="published"),
+            ),
+        ]
 
     def __str__(self):
         return self.title
 
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        if fields is None or kwargs or not load_deferred(self, list(fields), using):
+            super().refresh_from_db(using=using, fields=fields, **kwargs)
+
     def save(self, *args, **kwargs):
+        self.set_defaults()
+        if self.pk is not None:
+            # never write back a flag gone stale since the post was loaded
+            self.is_restricted = self.users.exists()
+        super().save(*args, **kwargs)
+        self.__dict__.pop("next", None)
+        self.__dict__.pop("prev", None)
+
+    def set_defaults(self, now=None):
         self.slug = slugify(self.title)
-        now = timezone.now()
+        now = timezone.now() if now is None else now
+        if self.pub_date_begin == PUBLICATION_DATE_MIN:
+            self.pub_date_begin = None
+        if self.pub_date_end == PUBLICATION_DATE_MAX:
+            self.pub_date_end = None
         if not self.event_date and self.status == PostModel.STATUS_PUBLISHED:
             self.event_date = now
         if not self.pub_date_begin and self.status == PostModel.STATUS_PUBLISHED:
             self.pub_date_begin = now
+        if self.normalize_publication_dates:
+            self.pub_date_begin = self.pub_date_begin or PUBLICATION_DATE_MIN
+            self.pub_date_end = self.pub_date_end or PUBLICATION_DATE_MAX
         if not self.uuid:
             self.uuid = uuid1()
-        super().save(*args, **kwargs)
 
-    @property
+    def get_preview_token(self):
+        """
+        Token for ``PreviewView``, valid for ``POSTS_PREVIEW_MAX_AGE`` seconds.
+        """
+        return make_token(self)
+
+    def translate(self, language=None):
+        language = (language or get_language() or "")[:2]
+        if getattr(self, "active_language", None) == language:
+            post = self
+            for name in ["default_translation", "active_translation"]:
+                translation = getattr(self, name, None)
+                if translation is not None:
+                    post = I18NProxy(translation, post)
+            return post
+        return super().translate(language)
+
+    def _get_neighbours(self):
+        # only public posts: next/prev end up in pages shared by every visitor,
+        # use with_neighbours() on a visible_to() queryset for the others
+        return self._meta.model.objects.all()._filter(status=self.status).visible_to(None)
+
+    @cached_property
     def next(self):
+        if self.pub_date_begin is None:
+            return None
         return (
-            self._meta.model.objects.filter(status=self.status, pub_date_begin__gt=self.pub_date_begin)
-            .order_by("pub_date_begin")
+            self._get_neighbours()
+            .filter(Q(pub_date_begin__gt=self.pub_date_begin) | Q(pub_date_begin=self.pub_date_begin, pk__gt=self.pk))
+            .order_by("pub_date_begin", "pk")
             .first()
         )
 
-    @property
+    @cached_property
     def prev(self):
+        if self.pub_date_begin is None:
+            return None
         return (
-            self._meta.model.objects.filter(status=self.status, pub_date_begin__lt=self.pub_date_begin)
-            .order_by("pub_date_begin")
+            self._get_neighbours()
+            .filter(Q(pub_date_begin__lt=self.pub_date_begin) | Q(pub_date_begin=self.pub_date_begin, pk__lt=self.pk))
+            .order_by("-pub_date_begin", "-pk")
             .first()
         )
 
 
+@receiver(class_prepared)
+def shorten_index_names(sender, **kwargs):
+    # "<app_label>_<model>_pub" of PostModel.Meta may exceed the 30 chars
+    # allowed to index names (models.E034): keep a prefix and a digest
+    if issubclass(sender, PostModel) and not sender._meta.abstract:
+        for index in sender._meta.indexes:
+            if index.name and len(index.name) > index.max_name_length:
+                index.name = "%s_%s" % (index.name[:21], names_digest(index.name, length=8))
+
+
+class RenderedModel(models.Model):
+    """
+    Add it to a post or a translation model to store ``abstract`` and
+    ``text`` as rendered by ``POSTS_RENDERER`` and a plain text ``excerpt``,
+    so templates don't have to process them on every request.
+    Existing rows are filled by the ``render_posts`` command.
+    """
+
+    abstract_html = models.TextField(blank=True, editable=False, verbose_name=_("Rendered abstract"))
+    text_html = models.TextField(blank=True, editable=False, verbose_name=_("Rendered text"))
+    excerpt = models.TextField(blank=True, editable=False, verbose_name=_("Excerpt"))
+
+    RENDERED_FIELDS = ["abstract_html", "text_html", "excerpt"]
+    list_deferred_fields = ["text", "note", "text_html"]
+
+    class Meta:
+        abstract = True
+
+    def render_body(self):
+        renderer = get_renderer()
+        self.abstract_html = renderer(self.abstract)
+        self.text_html = renderer(self.text)
+        self.excerpt = get_excerpt(self.abstract_html or self.text_html)
+
+    def save(self, *args, **kwargs):
+        self.render_body()
+        super().save(*args, **kwargs)
+
+
 class PostModelTranslation(models.TranslationModel):
     title = models.StringField(blank=True, verbose_name=_("Title"))
     slug = models.SlugField(blank=True, verbose_name=_("Slug field"))
     abstract = models.TextField(verbose_name=_("Abstract"), blank=True, help_text=_("A brief description"))
     text = models.TextField(blank=True, verbose_name=_("Body"))
 
+    list_deferred_fields = ["text"]
+
     class Meta:
         abstract = True
 
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        if fields is None or kwargs or not load_deferred(self, list(fields), using):
+            super().refresh_from_db(using=using, fields=fields, **kwargs)
+
     def save(self, *args, **kwargs):
         self.slug = slugify(self.title)
         super().save(*args, **kwargs)
@@ -152,5 +582,5 @@ if "comments" in settings.INSTALLED_APPS:
     class PostCommentModel(PostModel):
         can_comment = models.BooleanField(default=True, verbose_name=_("can comment"))
 
-        class Meta:
+        class Meta(PostModel.Meta):
             abstract = True
@@ -0,0 +1,90 @@
+# Copyright (C) 2007-2020, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from django.db import migrations
+
+from .models import PUBLICATION_DATE_MAX, PUBLICATION_DATE_MIN, get_restricted
+
+
+class NormalizePublicationDates(migrations.RunPython):
+    """
+    Data migration for a concrete post model which turns on
+    ``normalize_publication_dates``: NULL publication dates are replaced by
+    the sentinel bounds, and restored on reverse.
+
+        operations = [
+            NormalizePublicationDates("blog.Post"),
+        ]
+
+    The range scan needs the publication indexes of ``PostModel.Meta``,
+    which a concrete model only gets when its ``Meta`` subclasses it:
+
+        class Post(PostModel):
+            class Meta(PostModel.Meta):
+                ...
+    """
+
+    reduces_to_sql = False
+
+    def __init__(self, model, **kwargs):
+        self.model = model
+        super().__init__(self.normalize, self.denormalize, **kwargs)
+
+    def deconstruct(self):
+        return (self.__class__.__name__, [self.model], {})
+
+    def get_queryset(self, apps, schema_editor):
+        return apps.get_model(self.model)._base_manager.using(schema_editor.connection.alias)
+
+    def normalize(self, apps, schema_editor):
+        queryset = self.get_queryset(apps, schema_editor)
+        queryset.filter(pub_date_begin__isnull=True).update(pub_date_begin=PUBLICATION_DATE_MIN)
+        queryset.filter(pub_date_end__isnull=True).update(pub_date_end=PUBLICATION_DATE_MAX)
+
+    def denormalize(self, apps, schema_editor):
+        queryset = self.get_queryset(apps, schema_editor)
+        queryset.filter(pub_date_begin=PUBLICATION_DATE_MIN).update(pub_date_begin=None)
+        queryset.filter(pub_date_end=PUBLICATION_DATE_MAX).update(pub_date_end=None)
+
+
+class UpdateRestrictedPosts(migrations.RunPython):
+    """
+    Data migration filling ``is_restricted`` of the existing posts of a
+    concrete post model, to be run right after adding the field: until then
+    restricted posts are listed as public.
+
+        operations = [
+            migrations.AddField(...is_restricted...),
+            UpdateRestrictedPosts("blog.Post"),
+        ]
+    """
+
+    reduces_to_sql = False
+
+    def __init__(self, model, **kwargs):
+        self.model = model
+        super().__init__(self.update, migrations.RunPython.noop, **kwargs)
+
+    def deconstruct(self):
+        return (self.__class__.__name__, [self.model], {})
+
+    def update(self, apps, schema_editor):
+        model = apps.get_model(self.model)
+        model._base_manager.using(schema_editor.connection.alias).update(is_restricted=get_restricted(model))
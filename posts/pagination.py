@@ -0,0 +1,238 @@
+# Copyright (C) 2007-2020, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import base64
+import binascii
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger
+from django.db.models import F, Q
+from django.utils.functional import cached_property
+
+DEFAULT_ORDERING = ["-pub_date_begin"]
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorPage:
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return "<CursorPage of %d items>" % len(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Keyset (seek) paginator.
+
+    Instead of ``COUNT(*)`` and ``OFFSET``, every page is fetched with a
+    ``WHERE (key) > (last seen key) ORDER BY key LIMIT n`` query, so the cost
+    of a page does not depend on how deep it is.
+
+    The key is the queryset ordering (or ``DEFAULT_ORDERING`` when there is
+    none), with the primary key appended as a tie breaker. Ordering fields
+    must be local columns; NULLs of nullable ones (e.g. ``pub_date_begin``
+    of drafts) sort after every other value, in both directions.
+    """
+
+    def __init__(self, object_list, per_page, ordering=None):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.ordering = self._get_ordering(object_list.model, ordering or self._get_default_ordering(object_list))
+
+    def _get_default_ordering(self, queryset):
+        return queryset.query.order_by or queryset.model._meta.ordering or DEFAULT_ORDERING
+
+    def _get_ordering(self, model, ordering):
+        fields = []
+        for name in ordering:
+            if not isinstance(name, str) or name == "?":
+                raise ValueError("cursor pagination cannot be keyed on %r" % (name,))
+            descending = name.startswith("-")
+            name = name.lstrip("-+")
+            if name == "pk":
+                field = model._meta.pk
+            else:
+                try:
+                    field = model._meta.get_field(name)
+                except FieldDoesNotExist:
+                    raise ValueError("cursor pagination cannot be keyed on %r" % (name,))
+            if field.is_relation or not field.concrete:
+                raise ValueError("cursor pagination cannot be keyed on %r" % (name,))
+            fields.append((field, descending))
+        if model._meta.pk not in [field for field, descending in fields]:
+            fields.append((model._meta.pk, fields[-1][1] if fields else False))
+        return fields
+
+    def _get_order_by(self, reverse):
+        order_by = []
+        for field, descending in self.ordering:
+            if field.null:
+                # walking backwards, the NULLs at the end come first
+                expression = F(field.name).desc if descending != reverse else F(field.name).asc
+                order_by.append(expression(**({"nulls_first": True} if reverse else {"nulls_last": True})))
+            else:
+                order_by.append("%s%s" % ("-" if descending != reverse else "", field.name))
+        return order_by
+
+    def _get_after(self, field, descending, value, reverse):
+        """
+        Rows after ``value`` of ``field`` in the page order, or ``None`` when
+        there are none.
+        """
+        after = Q(**{"%s__%s" % (field.name, "lt" if descending != reverse else "gt"): value})
+        if not field.null:
+            return after
+        if value is None:
+            return None if not reverse else Q(**{"%s__isnull" % field.name: False})
+        return after if reverse else after | Q(**{"%s__isnull" % field.name: True})
+
+    def _get_seek(self, values, reverse):
+        q = Q()
+        for i, (field, descending) in enumerate(self.ordering):
+            seek = self._get_after(field, descending, values[i], reverse)
+            if seek is None:
+                continue
+            for j, (previous, _) in enumerate(self.ordering[:i]):
+                if values[j] is None:
+                    seek &= Q(**{"%s__isnull" % previous.name: True})
+                else:
+                    seek &= Q(**{previous.name: values[j]})
+            q |= seek
+        return q
+
+    def encode_cursor(self, obj, reverse=False):
+        values = [
+            None if field.value_from_object(obj) is None else field.value_to_string(obj)
+            for field, descending in self.ordering
+        ]
+        data = json.dumps([int(reverse), values], separators=(",", ":")).encode("utf-8")
+        return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+    def decode_cursor(self, cursor):
+        try:
+            data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            reverse, values = json.loads(data.decode("utf-8"))
+            if len(values) != len(self.ordering):
+                raise InvalidCursor("cursor does not match the ordering")
+            values = [
+                None if value is None else field.to_python(value)
+                for (field, descending), value in zip(self.ordering, values)
+            ]
+        except (TypeError, ValueError, binascii.Error, ValidationError) as err:
+            raise InvalidCursor(str(err))
+        return values, bool(reverse)
+
+    def _get_queryset(self, values, reverse):
+        queryset = self.object_list.order_by(*self._get_order_by(reverse))
+        if values is not None:
+            queryset = queryset.filter(self._get_seek(values, reverse))
+        return queryset[: self.per_page + 1]
+
+    def _get_page(self, object_list, values, reverse):
+        has_more = len(object_list) > self.per_page
+        object_list = object_list[: self.per_page]
+        if reverse:
+            object_list.reverse()
+
+        has_next, has_previous = (values is not None, has_more) if reverse else (has_more, values is not None)
+        next_cursor = self.encode_cursor(object_list[-1]) if has_next and object_list else None
+        previous_cursor = self.encode_cursor(object_list[0], reverse=True) if has_previous and object_list else None
+
+        return CursorPage(object_list, self, next_cursor=next_cursor, previous_cursor=previous_cursor)
+
+    def page(self, cursor=None):
+        values, reverse = self.decode_cursor(cursor) if cursor else (None, False)
+        return self._get_page(list(self._get_queryset(values, reverse)), values, reverse)
+
+    async def apage(self, cursor=None):
+        values, reverse = self.decode_cursor(cursor) if cursor else (None, False)
+        return self._get_page([obj async for obj in self._get_queryset(values, reverse)], values, reverse)
+
+
+class KeysetPaginator:
+    """
+    Numbered pages over ``object_list`` without ``OFFSET``.
+
+    The first primary key of every page (``bounds``) is read once with an
+    index only scan; page ``n`` is then ``WHERE pk >= bounds[n - 1]
+    ORDER BY pk LIMIT per_page``. Pass the ``bounds`` of a previous
+    paginator to skip the scan.
+    """
+
+    def __init__(self, object_list, per_page, bounds=None):
+        self.object_list = object_list.order_by("pk")
+        self.per_page = int(per_page)
+        if bounds is not None:
+            self.bounds = bounds
+
+    @cached_property
+    def bounds(self):
+        pks = self.object_list.values_list("pk", flat=True).iterator(chunk_size=self.per_page)
+        return [pk for i, pk in enumerate(pks) if i % self.per_page == 0]
+
+    @property
+    def num_pages(self):
+        return max(len(self.bounds), 1)
+
+    @property
+    def page_range(self):
+        return range(1, self.num_pages + 1)
+
+    def validate_number(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger("page %r is not an integer" % (number,))
+        if number < 1 or number > self.num_pages:
+            raise EmptyPage("page %d contains no results" % number)
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        object_list = self.object_list
+        if self.bounds:
+            object_list = object_list.filter(pk__gte=self.bounds[number - 1])
+        return Page(object_list[: self.per_page], number, self)
@@ -0,0 +1,41 @@
+# Copyright (C) 2007-2020, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from django.core import signing
+
+from . import settings
+
+SALT = "posts.preview"
+
+
+def make_token(post):
+    """
+    Signed, timestamped token granting a preview of ``post``, drafts included.
+    """
+    return signing.dumps(str(post.uuid), salt=SALT, compress=True)
+
+
+def get_uuid(token, max_age=None):
+    """
+    The post uuid of ``token``; raise ``signing.BadSignature`` (or
+    ``signing.SignatureExpired``) when it is forged or older than
+    ``max_age`` seconds (default: ``POSTS_PREVIEW_MAX_AGE``).
+    """
+    return signing.loads(token, salt=SALT, max_age=settings.PREVIEW_MAX_AGE if max_age is None else max_age)
@@ -0,0 +1,50 @@
+# Copyright (C) 2007-2020, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import functools
+import html
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.html import linebreaks, strip_tags
+from django.utils.module_loading import import_string
+from django.utils.text import Truncator
+
+from . import settings
+
+
+def linebreaks_renderer(text):
+    return linebreaks(text, autoescape=True) if text else ""
+
+
+def markdown_renderer(text):
+    try:
+        import markdown
+    except ImportError:
+        raise ImproperlyConfigured("posts.renderers.markdown_renderer requires the 'markdown' package")
+    return markdown.markdown(text) if text else ""
+
+
+@functools.lru_cache(maxsize=None)
+def get_renderer():
+    return import_string(settings.RENDERER)
+
+
+def get_excerpt(rendered):
+    return Truncator(html.unescape(strip_tags(rendered))).words(settings.EXCERPT_WORDS)
@@ -0,0 +1,300 @@
+# Copyright (C) 2007-2020, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from django.db import connections
+from django.db.models import Exists, F, FloatField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils.translation import get_language
+
+from . import settings
+
+# FTS5 rowid = post pk * ROWID_LANGUAGES + position of the language in
+# settings.LANGUAGES (0 for the post itself), so rows are replaced by rowid
+ROWID_LANGUAGES = 100
+
+
+def get_post_model(instance):
+    """
+    The post model of ``instance``, a post or a translation (or their model).
+    """
+    from .models import PostModel
+
+    model = instance if isinstance(instance, type) else type(instance)
+    return model if issubclass(model, PostModel) else model._meta.get_field("post").related_model
+
+
+def get_config(language):
+    return settings.SEARCH_CONFIGS.get((language or "")[:2], "simple")
+
+
+def get_table(post_model):
+    return "%s_fts" % post_model._meta.db_table
+
+
+def get_rowid(pk, language=None):
+    languages = [code for code, name in settings.LANGUAGES]
+    return pk * ROWID_LANGUAGES + (languages.index(language) + 1 if language else 0)
+
+
+def has_vector(model):
+    return any(field.name == "search_vector" for field in model._meta.concrete_fields)
+
+
+def uses_fts(connection):
+    return settings.SEARCH_INDEX and connection.vendor == "sqlite"
+
+
+class SearchResults:
+    """
+    FTS5 hits as ``(pk, rank)`` pairs, best first; slicing loads only the
+    posts of the slice, so ``Paginator`` can page them.
+    """
+
+    def __init__(self, queryset, ranks):
+        self.queryset = queryset
+        self.ranks = ranks
+
+    def count(self):
+        return len(self.ranks)
+
+    def __len__(self):
+        return len(self.ranks)
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[slice(index, index + 1 or None)][0]
+        from .models import PostRow
+
+        ranks = self.ranks[index]
+        # not in_bulk(), the queryset may fetch PostModelQuerySet.rows()
+        posts = {post.pk: post for post in self.queryset.filter(pk__in=[pk for pk, rank in ranks])}
+        results = []
+        for pk, rank in ranks:
+            if pk in posts:
+                post = posts[pk]
+                if isinstance(post, PostRow):
+                    post = PostRow(dict(post._values, rank=rank))
+                else:
+                    post.rank = rank
+                results.append(post)
+        return results
+
+
+def create_table(connection, post_model):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(language UNINDEXED, title, abstract, text)"
+            % connection.ops.quote_name(get_table(post_model))
+        )
+
+
+def get_vector(config):
+    from django.contrib.postgres.search import SearchVector
+
+    return (
+        SearchVector("title", weight="A", config=config)
+        + SearchVector("abstract", weight="B", config=config)
+        + SearchVector("text", weight="C", config=config)
+    )
+
+
+def insert(connection, post_model, instances):
+    """
+    Store ``instances`` (posts or translations of ``post_model``) in the FTS5
+    table, replacing their previous rows.
+    """
+    rows = []
+    for instance in instances:
+        if post_model is type(instance):
+            rows.append([get_rowid(instance.pk), "", instance.title, instance.abstract, instance.text])
+        else:
+            rowid = get_rowid(instance.post_id, instance.language)
+            rows.append([rowid, instance.language, instance.title, instance.abstract, instance.text])
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            "INSERT OR REPLACE INTO %s (rowid, language, title, abstract, text) VALUES (%%s, %%s, %%s, %%s, %%s)"
+            % connection.ops.quote_name(get_table(post_model)),
+            rows,
+        )
+
+
+def index(instance):
+    """
+    Store ``instance`` (a post or a translation) in the search index.
+    """
+    connection = connections[instance._state.db or "default"]
+    post_model = get_post_model(instance)
+    if connection.vendor == "postgresql" and has_vector(type(instance)):
+        config = get_config(getattr(instance, "language", settings.LANGUAGE_CODE))
+        manager = type(instance)._base_manager.using(connection.alias)
+        manager.filter(pk=instance.pk).update(search_vector=get_vector(config))
+    elif uses_fts(connection):
+        create_table(connection, post_model)
+        insert(connection, post_model, [instance])
+
+
+def index_batches(queryset, batch_size=1000):
+    """
+    Store the posts or translations of ``queryset`` in the search index: one
+    ``UPDATE`` per language on PostgreSQL, one insert per ``batch_size``
+    rows on SQLite. Yield the number of indexed rows after each statement.
+    """
+    model = queryset.model
+    connection = connections[queryset.db]
+    post_model = get_post_model(model)
+    if connection.vendor == "postgresql" and has_vector(model):
+        if model is post_model:
+            yield queryset.update(search_vector=get_vector(get_config(settings.LANGUAGE_CODE)))
+        else:
+            for language in queryset.order_by().values_list("language", flat=True).distinct():
+                yield queryset.filter(language=language).update(search_vector=get_vector(get_config(language)))
+    elif uses_fts(connection):
+        create_table(connection, post_model)
+        queryset, last = queryset.order_by("pk"), None
+        while True:
+            batch = list((queryset if last is None else queryset.filter(pk__gt=last))[:batch_size])
+            if not batch:
+                break
+            insert(connection, post_model, batch)
+            last = batch[-1].pk
+            yield len(batch)
+
+
+def index_all(queryset):
+    """
+    ``index()`` for the rows written without signals (``bulk_create()``,
+    ``bulk_update()``...); return the number of indexed rows.
+    """
+    return sum(index_batches(queryset))
+
+
+def unindex(instance):
+    """
+    Remove ``instance`` (a post with its translations, or a translation)
+    from the search index.
+    """
+    connection = connections[instance._state.db or "default"]
+    if not uses_fts(connection):
+        return
+    post_model = get_post_model(instance)
+    create_table(connection, post_model)
+    table = connection.ops.quote_name(get_table(post_model))
+    with connection.cursor() as cursor:
+        if post_model is type(instance):
+            first = get_rowid(instance.pk)
+            cursor.execute(
+                "DELETE FROM %s WHERE rowid BETWEEN %%s AND %%s" % table, [first, first + ROWID_LANGUAGES - 1]
+            )
+        else:
+            cursor.execute("DELETE FROM %s WHERE rowid = %%s" % table, [get_rowid(instance.post_id, instance.language)])
+
+
+def _search_postgresql(queryset, query, translation_model, language):
+    from django.contrib.postgres.search import SearchQuery, SearchRank
+
+    search_query = SearchQuery(query, config=get_config(settings.LANGUAGE_CODE))
+    rank = SearchRank(F("search_vector"), search_query)
+    matches = Q(search_vector=search_query)
+    if translation_model is not None and has_vector(translation_model):
+        translation_query = SearchQuery(query, config=get_config(language))
+        translations = translation_model._base_manager.filter(
+            post=OuterRef("pk"), language__startswith=language, search_vector=translation_query
+        )
+        translation_rank = translations.annotate(rank=SearchRank(F("search_vector"), translation_query)).values("rank")
+        rank = Greatest(rank, Coalesce(Subquery(translation_rank[:1]), Value(0.0), output_field=FloatField()))
+        matches |= Q(Exists(translations))
+    return queryset.filter(matches).annotate(rank=rank).order_by("-rank", "-pk")
+
+
+def _search_sqlite(queryset, query, language):
+    connection = connections[queryset.db]
+    create_table(connection, queryset.model)
+    table = connection.ops.quote_name(get_table(queryset.model))
+    terms = " ".join('"%s"' % term.replace('"', '""') for term in query.split())
+    where = "%s MATCH %%s AND (language = '' OR language LIKE %%s)" % table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT rowid, rank FROM %s WHERE %s ORDER BY rank LIMIT %%s" % (table, where),
+            [terms, language + "%", settings.SEARCH_MAX_RESULTS],
+        )
+        ranked = {}
+        for rowid, rank in cursor.fetchall():
+            # rows are best first, keep the post or translation ranked first
+            ranked.setdefault(rowid // ROWID_LANGUAGES, rank)
+    # apply the publication window/visibility of queryset, in the database
+    allowed = set(queryset.filter(pk__in=list(ranked)).values_list("pk", flat=True))
+    return SearchResults(queryset, [(pk, -rank) for pk, rank in ranked.items() if pk in allowed])
+
+
+def _search_fallback(queryset, query, translation_model, language):
+    matches = Q()
+    for term in query.split():
+        q = Q(title__icontains=term) | Q(abstract__icontains=term) | Q(text__icontains=term)
+        if translation_model is not None:
+            q |= Q(
+                Exists(
+                    translation_model._base_manager.filter(post=OuterRef("pk"), language__startswith=language).filter(
+                        Q(title__icontains=term) | Q(abstract__icontains=term) | Q(text__icontains=term)
+                    )
+                )
+            )
+        matches &= q
+    return queryset.filter(matches).annotate(rank=Value(0.0, output_field=FloatField()))
+
+
+def search(queryset, query, translation_model=None, language=None):
+    """
+    Posts of ``queryset`` matching ``query`` in their own fields or in the
+    ``language`` (default: active language) translation, best first, with a
+    ``rank`` attribute.
+
+    Uses the ``search_vector`` column (see ``posts.postgres``) on PostgreSQL,
+    the FTS5 shadow table on SQLite when ``POSTS_SEARCH_INDEX`` is on (only
+    the ``POSTS_SEARCH_MAX_RESULTS`` best matches), and plain ``icontains``
+    lookups otherwise.
+    """
+    language = (language or get_language() or "")[:2]
+    connection = connections[queryset.db]
+    if connection.vendor == "postgresql" and has_vector(queryset.model):
+        return _search_postgresql(queryset, query, translation_model, language)
+    if uses_fts(connection):
+        return _search_sqlite(queryset, query, language)
+    return _search_fallback(queryset, query, translation_model, language)
+
+
+def rebuild(post_model, translation_model=None, batch_size=1000):
+    """
+    Index again every post and translation; yield the number of indexed rows
+    after each batch.
+    """
+    connection = connections[post_model._base_manager.db]
+    if uses_fts(connection):
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TABLE IF EXISTS %s" % connection.ops.quote_name(get_table(post_model)))
+    count = 0
+    for model in [post_model, translation_model]:
+        if model is None:
+            continue
+        for indexed in index_batches(model._base_manager.all(), batch_size):
+            count += indexed
+            yield count
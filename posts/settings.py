@@ -0,0 +1,39 @@
+# Copyright (C) 2007-2020, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from django.conf import settings
+
+CACHE = getattr(settings, "POSTS_CACHE", "default")
+PUBLISHED_CACHE_TIMEOUT = getattr(settings, "POSTS_PUBLISHED_CACHE_TIMEOUT", 60 * 60)
+SLUG_CACHE_SIZE = getattr(settings, "POSTS_SLUG_CACHE_SIZE", 1024)
+RENDER_CACHE_TIMEOUT = getattr(settings, "POSTS_RENDER_CACHE_TIMEOUT", 60 * 5)
+RENDERER = getattr(settings, "POSTS_RENDERER", "posts.renderers.linebreaks_renderer")
+EXCERPT_WORDS = getattr(settings, "POSTS_EXCERPT_WORDS", 50)
+LANGUAGE_CODE = getattr(settings, "LANGUAGE_CODE")
+LANGUAGES = getattr(settings, "LANGUAGES")
+SEARCH_INDEX = getattr(settings, "POSTS_SEARCH_INDEX", False)
+SEARCH_CONFIGS = getattr(settings, "POSTS_SEARCH_CONFIGS", {"en": "english", "it": "italian"})
+SEARCH_MAX_RESULTS = getattr(settings, "POSTS_SEARCH_MAX_RESULTS", 1000)
+FEED_CACHE_TIMEOUT = getattr(settings, "POSTS_FEED_CACHE_TIMEOUT", 60 * 60 * 24)
+INSTRUMENTATION = getattr(settings, "POSTS_INSTRUMENTATION", False)
+METRICS_CALLBACK = getattr(settings, "POSTS_METRICS_CALLBACK", None)
+PREVIEW_MAX_AGE = getattr(settings, "POSTS_PREVIEW_MAX_AGE", 60 * 60 * 24 * 7)
+PREVIEW_CACHE_TIMEOUT = getattr(settings, "POSTS_PREVIEW_CACHE_TIMEOUT", 30)
+TAG_SUPERSET_SIZE = getattr(settings, "POSTS_TAG_SUPERSET_SIZE", 20)
@@ -0,0 +1,103 @@
+# Copyright (C) 2007-2020, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+from fluo.db.models import CategoryModel
+
+from .cache import bump_version, invalidate_published, invalidate_rendered
+from .models import PostModel, PostModelTranslation, get_restricted
+from .search import index, unindex
+
+# sent with ``metric`` (posts.instrumentation.Metric) and ``request``
+measured = Signal()
+
+
+@receiver([post_save, post_delete])
+def invalidate_published_cache(sender, instance, **kwargs):
+    if isinstance(instance, PostModel):
+        transaction.on_commit(lambda: invalidate_published(sender))
+
+
+@receiver([post_save, post_delete])
+def invalidate_rendered_cache(sender, instance, **kwargs):
+    if isinstance(instance, PostModel):
+        transaction.on_commit(partial(invalidate_rendered, sender, instance.pk))
+    elif isinstance(instance, PostModelTranslation):
+        post_model = instance._meta.get_field("post").related_model
+        transaction.on_commit(partial(invalidate_rendered, post_model, instance.post_id))
+
+
+@receiver([post_save, post_delete])
+def touch_translated_post(sender, instance, raw=False, **kwargs):
+    # translated pages are served with the Last-Modified of their post
+    if not raw and isinstance(instance, PostModelTranslation):
+        post_model = instance._meta.get_field("post").related_model
+        post_model._base_manager.filter(pk=instance.post_id).update(last_modified_at=timezone.now())
+
+
+@receiver([post_save, post_delete])
+def invalidate_category_ids(sender, instance, **kwargs):
+    if isinstance(instance, CategoryModel):
+        transaction.on_commit(partial(bump_version, sender))
+
+
+@receiver(m2m_changed)
+def invalidate_rendered_relations(sender, instance, action, model, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if isinstance(instance, PostModel):
+        transaction.on_commit(partial(invalidate_rendered, type(instance), instance.pk))
+    elif issubclass(model, PostModel):
+        for pk in pk_set or [None]:
+            transaction.on_commit(partial(invalidate_rendered, model, pk))
+
+
+@receiver(m2m_changed)
+def update_restricted(sender, instance, action, model, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if isinstance(instance, PostModel):
+        if sender is instance._meta.get_field("users").remote_field.through:
+            instance.is_restricted = action == "post_add" or instance.users.exists()
+            type(instance)._base_manager.filter(pk=instance.pk).update(is_restricted=instance.is_restricted)
+    elif issubclass(model, PostModel) and sender is model._meta.get_field("users").remote_field.through:
+        if action == "post_add":
+            model._base_manager.filter(pk__in=pk_set).update(is_restricted=True)
+        elif action == "post_remove":
+            model._base_manager.filter(pk__in=pk_set).update(is_restricted=get_restricted(model))
+        else:
+            model._base_manager.filter(is_restricted=True).update(is_restricted=get_restricted(model))
+
+
+@receiver(post_save)
+def update_search_index(sender, instance, raw=False, **kwargs):
+    if not raw and isinstance(instance, (PostModel, PostModelTranslation)):
+        index(instance)
+
+
+@receiver(post_delete)
+def remove_search_index(sender, instance, **kwargs):
+    if isinstance(instance, (PostModel, PostModelTranslation)):
+        unindex(instance)
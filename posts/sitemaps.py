@@ -0,0 +1,148 @@
+# Copyright (C) 2007-2020, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from django.contrib.sitemaps import Sitemap
+from django.db.models import Max
+from django.urls import reverse
+from django.utils import translation
+from django.utils.xmlutils import SimplerXMLGenerator
+
+from . import settings
+from .cache import get_cache, get_published_now, get_render_key, get_version
+from .pagination import KeysetPaginator
+
+
+class PostSitemap(Sitemap):
+    """
+    Published public posts, in ``language``: the posts themselves for the
+    default language (or no ``language``), their translations otherwise.
+
+    Pages of ``limit`` urls are fetched by primary key ranges instead of
+    ``OFFSET``; the ranges are cached until a post changes.
+    """
+
+    post_model = None
+    translation_model = None
+    # url reversed, in the sitemap language, with the (translated) ``slug``
+    # kwarg; without it the url is ``post.get_absolute_url()``
+    url_name = None
+
+    def __init__(self, language=None, post_model=None, translation_model=None, url_name=None):
+        self.language = language
+        self.post_model = post_model or self.post_model
+        self.translation_model = translation_model or self.translation_model
+        self.url_name = url_name or self.url_name
+
+    @property
+    def translated(self):
+        return self.translation_model is not None and self.language not in (None, settings.LANGUAGE_CODE[:2])
+
+    def get_posts(self):
+        return self.post_model.objects.cached_published().visible_to(None)
+
+    def items(self):
+        if self.translated:
+            return self.translation_model._base_manager.filter(
+                language__startswith=self.language, post__in=self.get_posts().values("pk")
+            ).select_related("post")
+        return self.get_posts()
+
+    @property
+    def paginator(self):
+        cache = get_cache()
+        key = get_render_key(
+            "sitemap",
+            self.post_model._meta.label_lower,
+            self.language,
+            self.limit,
+            get_version(self.post_model),
+            # the pages also change when a post enters or leaves its publication window
+            get_published_now(self.post_model),
+        )
+        bounds = cache.get(key)
+        paginator = KeysetPaginator(self.items(), self.limit, bounds)
+        if bounds is None:
+            cache.set(key, paginator.bounds, settings.PUBLISHED_CACHE_TIMEOUT)
+        return paginator
+
+    def get_post(self, item):
+        return item.post if self.translated else item
+
+    def location(self, item):
+        post = self.get_post(item)
+        with translation.override(self.language or settings.LANGUAGE_CODE):
+            if self.url_name is None:
+                return post.get_absolute_url()
+            return reverse(self.url_name, kwargs={"slug": item.slug or post.slug})
+
+    def lastmod(self, item):
+        return self.get_post(item).last_modified_at
+
+    def get_latest_lastmod(self):
+        return self.get_posts().aggregate(lastmod=Max("last_modified_at"))["lastmod"]
+
+
+def get_sitemaps(post_model, translation_model=None, url_name=None, languages=None):
+    """
+    ``{section: sitemap}`` for ``django.contrib.sitemaps.views``: one
+    section for the posts and one for each language of ``languages``
+    (default: ``LANGUAGES``) when a ``translation_model`` is given.
+    """
+    sitemaps = {"posts": PostSitemap(None, post_model, translation_model, url_name)}
+    if translation_model is not None:
+        for language in languages or [code for code, name in settings.LANGUAGES]:
+            if language[:2] != settings.LANGUAGE_CODE[:2]:
+                sitemaps["posts-%s" % language] = PostSitemap(language, post_model, translation_model, url_name)
+    return sitemaps
+
+
+def write_urlset(outfile, urls):
+    """
+    Write a sitemap of ``urls`` (as returned by ``Sitemap.get_urls()``)
+    to ``outfile``, one url at a time.
+    """
+    handler = SimplerXMLGenerator(outfile, "utf-8")
+    handler.startDocument()
+    handler.startElement("urlset", {"xmlns": "http://www.sitemaps.org/schemas/sitemap/0.9"})
+    for url in urls:
+        handler.startElement("url", {})
+        handler.addQuickElement("loc", url["location"])
+        if url.get("lastmod"):
+            handler.addQuickElement("lastmod", url["lastmod"].isoformat())
+        handler.endElement("url")
+    handler.endElement("urlset")
+    handler.endDocument()
+
+
+def write_index(outfile, sitemaps):
+    """
+    Write a sitemap index of ``sitemaps``, ``(location, lastmod)`` pairs.
+    """
+    handler = SimplerXMLGenerator(outfile, "utf-8")
+    handler.startDocument()
+    handler.startElement("sitemapindex", {"xmlns": "http://www.sitemaps.org/schemas/sitemap/0.9"})
+    for location, lastmod in sitemaps:
+        handler.startElement("sitemap", {})
+        handler.addQuickElement("loc", location)
+        if lastmod is not None:
+            handler.addQuickElement("lastmod", lastmod.isoformat())
+        handler.endElement("sitemap")
+    handler.endElement("sitemapindex")
+    handler.endDocument()
@@ -18,22 +18,121 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+from collections import namedtuple
+
 from django import template
 from django.core.paginator import Paginator, InvalidPage, EmptyPage
-from django.template import TemplateSyntaxError
+from django.http import Http404
+from django.template import TemplateSyntaxError, Variable, VariableDoesNotExist
+from django.template.base import FilterExpression
+from django.utils import timezone
+from django.utils.translation import get_language
+
+from .. import settings
+from ..cache import get_cache, get_published_timeout, get_render_key, get_version
+from ..instrumentation import instrument
+from ..lookups import get_post
+from ..pagination import CursorPaginator, InvalidCursor
 
 
 register = template.Library()
 
 
+INTEGER_OPTIONS = ("limit", "paginate_by", "cache")
+LIST_OPTIONS = ("category", "all_categories", "order_by", "only", "defer", "rows")
+
+# the resolved options of a get_*_posts tag
+Plan = namedtuple("Plan", ("cursor",) + INTEGER_OPTIONS + LIST_OPTIONS)
+
+
+def _is_bare_word(expression):
+    var = expression.var
+    return not expression.filters and isinstance(var, Variable) and var.lookups == (expression.token,)
+
+
+def _get_literal(expression):
+    """
+    Value of ``expression`` when it is a constant, ``Variable`` otherwise.
+    Bare words are constants (``category news``), as they always were: only
+    dotted names and filtered values are variables.
+    """
+    var = expression.var
+    if _is_bare_word(expression) and not var.translate:
+        return expression.token
+    if expression.filters or (isinstance(var, Variable) and (var.lookups is not None or var.translate)):
+        return Variable
+    return var.literal if isinstance(var, Variable) else var
+
+
+def _resolve_option(tag_name, key, expression, context):
+    """
+    Value of the variable ``expression``; a dotted name which does not
+    resolve is an error, instead of silently dropping the option.
+    """
+    if isinstance(expression.var, Variable) and not expression.filters:
+        try:
+            return expression.var.resolve(context)
+        except VariableDoesNotExist:
+            raise TemplateSyntaxError("'%s' could not resolve '%s' (got %r)" % (tag_name, key, expression.token))
+    return expression.resolve(context)
+
+
+def _clean_option(tag_name, key, value):
+    if value is None or value == "":
+        return None
+    if key in INTEGER_OPTIONS:
+        try:
+            return int(value)
+        except (TypeError, ValueError) as err:
+            raise TemplateSyntaxError(
+                "'%s' requires '%s' to be a valid integer (got %r): %s" % (tag_name, key, value, err)
+            )
+    if isinstance(value, str):
+        value = value.split(",")
+    return tuple(str(item).strip() for item in value if str(item).strip()) or None
+
+
+def _get_plan(tag_name, cursor, options):
+    plan = Plan(cursor=cursor, **{key: _clean_option(tag_name, key, value) for key, value in options.items()})
+    if cursor:
+        if not plan.paginate_by:
+            raise TemplateSyntaxError("'%s' requires 'paginate_by' to use 'cursor'" % tag_name)
+        if plan.limit:
+            raise TemplateSyntaxError("'%s' cannot use 'limit' together with 'cursor'" % tag_name)
+    if plan.cache is not None and plan.paginate_by:
+        raise TemplateSyntaxError("'%s' cannot use 'cache' together with 'paginate_by'" % tag_name)
+    if plan.cache is not None and not plan.limit:
+        raise TemplateSyntaxError("'%s' requires 'limit' to use 'cache'" % tag_name)
+    return plan
+
+
 class GetPostListNode(template.Node):
-    def __init__(self, name, category=None, order_by=None, limit=None, query_set=None, paginate_by=False):
+    """
+    Options given as literals are parsed once, into the node ``plan``, and
+    the queryset they describe is built once per language (and categories
+    version): rendering only applies the manager method, the visibility and
+    the slice/pagination to a clone of it. Options given as variables are
+    resolved and applied at every render.
+    """
+
+    def __init__(self, name, query_set, translation_model=None, cursor=False, options=None, tag_name=None):
         self.name = name
-        self.limit = limit
+        self.tag_name = tag_name
         self.query_set = query_set
-        self.category = category
-        self.order_by = order_by
-        self.paginate_by = paginate_by
+        self.translation_model = translation_model
+        self.cursor = cursor
+        self.options = options or {}
+        self.variables = {key: value for key, value in self.options.items() if isinstance(value, FilterExpression)}
+        self.plan = None if self.variables else _get_plan(tag_name, cursor, self.options)
+        self.querysets = {}
+
+    def get_plan(self, context):
+        if self.plan is not None:
+            return self.plan
+        options = dict(self.options)
+        for key, expression in self.variables.items():
+            options[key] = _resolve_option(self.tag_name, key, expression, context)
+        return _get_plan(self.tag_name, self.cursor, options)
 
     def _paginate(self, request, post_list, paginate_by):
         paginator = Paginator(post_list, paginate_by)
@@ -50,37 +149,140 @@ class GetPostListNode(template.Node):
 
         return post
 
-    def render(self, context):
-        post = self.query_set()
+    def _cursor_paginate(self, request, post_list, paginate_by):
+        paginator = CursorPaginator(post_list, paginate_by)
 
-        if self.category:
-            post = post.filter(categories__name__in=self.category)
+        try:
+            post = paginator.page(request.GET.get("cursor"))
+        except InvalidCursor:
+            raise Http404
+
+        return post
+
+    def build_queryset(self, plan):
+        """
+        The part of the queryset depending only on ``plan``, the active
+        language and the categories: never evaluated, only cloned.
+        """
+        post = self.query_set.__self__.all()
+        if self.translation_model is not None:
+            post = post.with_translation()
+
+        if plan.category:
+            post = post.in_categories(plan.category)
 
-        if self.order_by:
-            post = post.order_by(*self.order_by)
+        if plan.all_categories:
+            post = post.in_categories(plan.all_categories, match_all=True)
 
-        if self.limit:
-            post = post[: self.limit]
+        if plan.order_by:
+            post = post.order_by(*plan.order_by)
 
-        if self.paginate_by:
-            request = context["request"]
-            post = self._paginate(request, post, self.paginate_by)
+        if plan.rows:
+            post = post.rows(*plan.rows)
+        else:
+            post = post.for_list(only=plan.only, defer=plan.defer)
+        return post
+
+    def get_queryset(self, plan, user):
+        if plan is not self.plan:
+            post = self.build_queryset(plan)
+        else:
+            language, version = get_language(), None
+            if plan.category or plan.all_categories:
+                model = self.query_set.__self__.model
+                version = get_version(model._meta.get_field("categories").related_model)
+            built = self.querysets.get(language)
+            if built is None or built[0] != version:
+                built = self.querysets[language] = (version, self.build_queryset(plan))
+            post = built[1]
+        return getattr(post, self.query_set.__name__)().visible_to(user)
+
+    def get_memo_key(self, plan, *parts):
+        """
+        Key shared by the tags of a request asking for the same posts,
+        whatever their tag and variable names.
+        """
+        return (
+            self.query_set.__self__.model._meta.label_lower,
+            self.query_set.__name__,
+            get_language(),
+            self.translation_model is not None,
+            plan._replace(
+                category=plan.category and tuple(sorted(plan.category)),
+                all_categories=plan.all_categories and tuple(sorted(plan.all_categories)),
+            ),
+        ) + parts
+
+    def get_superset(self, queryset, plan, key, size):
+        """
+        The first ``size`` posts of ``queryset``; from the cache when the tag
+        has a ``cache`` timeout.
+        """
+        if plan.cache is None:
+            return list(queryset[:size])
+        model = queryset.model
+        cache_key = get_render_key("tags", get_version(model), size, *key)
+        posts = get_cache().get(cache_key)
+        if posts is None:
+            posts = list(queryset[:size])
+            timeout = get_published_timeout(model.objects.all(), model.STATUS_PUBLISHED, timezone.now())
+            get_cache().set(cache_key, posts, min(plan.cache, timeout))
+        return posts
+
+    @instrument
+    def render(self, context):
+        request = context.get("request")
+        plan = self.get_plan(context)
+        # cached lists are shared between users, so they hold only public posts
+        user = None if plan.cache is not None else getattr(request, "user", None)
+        memo = request.__dict__.setdefault("_posts_lists", {}) if request is not None else {}
+
+        if plan.paginate_by:
+            page = request.GET.get("cursor" if plan.cursor else "page")
+            key = self.get_memo_key(plan, "page", page)
+            if key not in memo:
+                post = self.get_queryset(plan, user)
+                if plan.limit:
+                    post = post[: plan.limit]
+                if plan.cursor:
+                    memo[key] = self._cursor_paginate(request, post, plan.paginate_by)
+                else:
+                    memo[key] = self._paginate(request, post, plan.paginate_by)
+            post = memo[key]
+        elif plan.limit:
+            # "latest N" lists are sliced from a single superset per request,
+            # so they are plain lists of posts, not querysets
+            key = self.get_memo_key(plan._replace(limit=None), "latest")
+            size, posts = memo.get(key, (0, None))
+            if size < plan.limit:
+                size = max(plan.limit, settings.TAG_SUPERSET_SIZE)
+                posts = self.get_superset(self.get_queryset(plan, user), plan, key, size)
+                memo[key] = (size, posts)
+            post = posts[: plan.limit]
+        else:
+            key = self.get_memo_key(plan, "all")
+            if key not in memo:
+                memo[key] = self.get_queryset(plan, user)
+            post = memo[key]
 
         context[self.name] = post
         return ""
 
 
-def _get_posts(parser, token, tag_name, query_set=None):
+def _get_posts(parser, token, tag_name, query_set=None, translation_model=None):
     args = token.split_contents()[1:]
-    kwargs = {
-        "as": None,
-        "limit": None,
-        "category": None,
-        "order_by": None,
-        "paginate_by": None,
-        "query_set": query_set,
-    }
-    kw = kwargs.keys()
+    options = {key: None for key in INTEGER_OPTIONS + LIST_OPTIONS}
+    name = None
+
+    # "cursor" is a flag modifier of "paginate_by", not a key/value pair
+    cursor = False
+    i = 0
+    while i < len(args):
+        if args[i] == "cursor":
+            cursor = True
+            del args[i]
+        else:
+            i += 2
 
     if len(args) < 2:
         raise TemplateSyntaxError("'%s' requires at least 'as variable' (got %r)" % (tag_name, args))
@@ -90,23 +292,30 @@ def _get_posts(parser, token, tag_name, query_set=None):
     while i < len(args):
         key = args[i]
         value = args[i + 1]
-        if key in kw:
-            if key in ("limit", "paginate_by"):
-                try:
-                    value = int(value)
-                except ValueError as err:
-                    raise TemplateSyntaxError(
-                        "'%s' requires 'limit' to be a valid integer (got %r): %s" % (tag_name, value, err)
-                    )
-            elif key in ("order_by", "category"):
-                value = value.split(",")
-            kwargs[key] = value
-            i += 2
+        if key == "as":
+            name = value
+        elif key in options:
+            try:
+                expression = parser.compile_filter(value)
+            except TemplateSyntaxError:
+                # not an expression, e.g. order_by -date or category main,news
+                options[key] = _clean_option(tag_name, key, value)
+            else:
+                literal = _get_literal(expression)
+                options[key] = expression if literal is Variable else _clean_option(tag_name, key, literal)
         else:
             raise TemplateSyntaxError("'%s' unknown keyword (got %r)" % (tag_name, key))
-    kwargs["name"] = kwargs["as"]
-    kwargs.pop("as")
-    return GetPostListNode(**kwargs)
+        i += 2
+    if name is None:
+        raise TemplateSyntaxError("'%s' requires 'as variable' (got %r)" % (tag_name, args))
+    return GetPostListNode(
+        name=name,
+        query_set=query_set,
+        translation_model=translation_model,
+        cursor=cursor,
+        options=options,
+        tag_name=tag_name,
+    )
 
 
 @register.tag
@@ -119,15 +328,23 @@ def get_all_posts(parser, token, name="get_all_posts", post_model=None, translat
 
         {% get_all_posts as posts %}
         {% get_all_posts as posts paginate_by 25 %}
+        {% get_all_posts as posts paginate_by 25 cursor %}
         {% get_all_posts as posts limit 5 %}
         {% get_all_posts as posts category "main"  %}
+        {% get_all_posts as posts category "main,news"  %}
+        {% get_all_posts as posts all_categories "main,news"  %}
         {% get_all_posts as posts order_by "-date"  %}
+        {% get_all_posts as posts only "title,slug,abstract"  %}
+        {% get_all_posts as posts defer "text,note"  %}
+        {% get_all_posts as posts rows "title,abstract"  %}
+        {% get_all_posts as posts limit 5 cache 60 %}
+        {% get_all_posts as posts category post.category.name limit per_page|default:5 %}
 
         {% for post in posts %}
         ...
         {% endfor %}
     """
-    return _get_posts(parser, token, name, post_model.objects.all)
+    return _get_posts(parser, token, name, post_model.objects.all, translation_model)
 
 
 @register.tag
@@ -140,15 +357,23 @@ def get_published_posts(parser, token, name="get_published_posts", post_model=No
 
         {% get_published_posts as posts %}
         {% get_published_posts as posts paginate_by 25 %}
+        {% get_published_posts as posts paginate_by 25 cursor %}
         {% get_published_posts as posts limit 5 %}
         {% get_published_posts as posts category "main"  %}
+        {% get_published_posts as posts category "main,news"  %}
+        {% get_published_posts as posts all_categories "main,news"  %}
         {% get_published_posts as posts order_by "-date"  %}
+        {% get_published_posts as posts only "title,slug,abstract"  %}
+        {% get_published_posts as posts defer "text,note"  %}
+        {% get_published_posts as posts rows "title,abstract"  %}
+        {% get_published_posts as posts limit 5 cache 60 %}
+        {% get_published_posts as posts category post.category.name limit per_page|default:5 %}
 
         {% for post in posts %}
         ...
         {% endfor %}
     """
-    return _get_posts(parser, token, name, post_model.objects.published)
+    return _get_posts(parser, token, name, post_model.objects.cached_published, translation_model)
 
 
 @register.tag
@@ -161,32 +386,41 @@ def get_draft_posts(parser, token, name="get_draft_posts", post_model=None, tran
 
         {% get_draft_posts as posts %}
         {% get_draft_posts as posts paginate_by 25 %}
+        {% get_draft_posts as posts paginate_by 25 cursor %}
         {% get_draft_posts as posts limit 5 %}
         {% get_draft_posts as posts category "main"  %}
+        {% get_draft_posts as posts category "main,news"  %}
+        {% get_draft_posts as posts all_categories "main,news"  %}
         {% get_draft_posts as posts order_by "-date"  %}
+        {% get_draft_posts as posts only "title,slug,abstract"  %}
+        {% get_draft_posts as posts defer "text,note"  %}
+        {% get_draft_posts as posts rows "title,abstract"  %}
+        {% get_draft_posts as posts limit 5 cache 60 %}
+        {% get_draft_posts as posts category post.category.name limit per_page|default:5 %}
 
         {% for post in posts %}
         ...
         {% endfor %}
     """
-    return _get_posts(parser, token, name, post_model.objects.draft)
+    return _get_posts(parser, token, name, post_model.objects.draft, translation_model)
 
 
 class GetPostNode(template.Node):
-    def __init__(self, name, post_model, translation_model):
+    def __init__(self, name, post_model, translation_model, tag_name=None):
         self.name = name
+        self.tag_name = tag_name
         self.post_model = post_model
         self.translation_model = translation_model
 
+    @instrument
     def render(self, context):
         slug = context["params"]["slug"]
-        if self.translation_model is not None:
-            try:
-                post = self.translation_model.objects.get(slug=slug).post
-            except self.translation_model.DoesNotExist:
-                post = self.post_model.objects.get(slug=slug)
-        else:
-            post = self.post_model.objects.get(slug=slug)
+        request = context.get("request")
+        queryset = self.post_model.objects.cached_published().visible_to(getattr(request, "user", None))
+        try:
+            post = get_post(request, queryset, slug, self.translation_model)
+        except self.post_model.DoesNotExist:
+            post = None
         context[self.name] = post
 
         return ""
@@ -202,4 +436,4 @@ def get_posts(parser, token, name="get_posts", post_model=None, translation_mode
     args = token.split_contents()
     if len(args) < 3:
         raise TemplateSyntaxError("'%(name)s' requires 'as variable' (got %(args)r)" % {"name": name, "args": args})
-    return GetPostNode(name=args[2], post_model=post_model, translation_model=translation_model)
+    return GetPostNode(name=args[2], post_model=post_model, translation_model=translation_model, tag_name=name)
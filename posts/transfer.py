@@ -0,0 +1,219 @@
+# Copyright (C) 2007-2020, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import json
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F
+
+from .cache import invalidate_posts
+from .models import get_restricted
+from .search import index_all
+
+
+def get_fields(model):
+    """
+    Fields moved between environments: local columns only, without the pk,
+    relations and the derived ``is_restricted`` flag.
+    """
+    return [
+        field
+        for field in model._meta.concrete_fields
+        if not field.primary_key and not field.is_relation and field.name != "is_restricted"
+    ]
+
+
+def dump_value(field, obj):
+    return None if field.value_from_object(obj) is None else field.value_to_string(obj)
+
+
+def load_value(field, value):
+    return None if value is None else field.to_python(value)
+
+
+def _get_users(post_model):
+    users = post_model._meta.get_field("users")
+    return users.remote_field.through, users.m2m_field_name(), users.m2m_reverse_field_name()
+
+
+def export_posts(post_model, translation_model=None, chunk_size=2000):
+    """
+    Yield posts, then translations, as NDJSON lines, streaming the rows with
+    ``iterator()``. Translations refer to their post by ``uuid``, restricted
+    posts carry the natural keys of their users.
+    """
+    through, source, target = _get_users(post_model)
+    username = "%s__%s" % (target, get_user_model().USERNAME_FIELD)
+
+    fields = get_fields(post_model)
+    for post in post_model._base_manager.order_by("pk").iterator(chunk_size=chunk_size):
+        data = {
+            "model": post._meta.label_lower,
+            "fields": {field.name: dump_value(field, post) for field in fields},
+        }
+        if post.is_restricted:
+            data["users"] = list(through._base_manager.filter(**{source: post.pk}).values_list(username, flat=True))
+        yield json.dumps(data)
+
+    if translation_model is not None:
+        fields = get_fields(translation_model)
+        queryset = translation_model._base_manager.annotate(post_uuid=F("post__uuid")).order_by("pk")
+        for translation in queryset.iterator(chunk_size=chunk_size):
+            yield json.dumps(
+                {
+                    "model": translation._meta.label_lower,
+                    "post": translation.post_uuid,
+                    "fields": {field.name: dump_value(field, translation) for field in fields},
+                }
+            )
+
+
+class Importer:
+    """
+    Upsert the NDJSON lines written by ``export_posts`` in batches of
+    ``batch_size`` rows: posts are matched on ``key`` (``uuid`` or ``slug``),
+    translations on their post ``uuid`` and language.
+    """
+
+    def __init__(self, post_model, translation_model=None, key="uuid", batch_size=1000, on_flush=None):
+        self.post_model = post_model
+        self.translation_model = translation_model
+        self.key = key
+        self.batch_size = batch_size
+        self.on_flush = on_flush
+        self.post_fields = get_fields(post_model)
+        self.translation_fields = [] if translation_model is None else get_fields(translation_model)
+        self.posts = []
+        self.translations = []
+        self.created = 0
+        self.updated = 0
+        self.errors = []
+
+    def add(self, line, lineno=None):
+        try:
+            data = json.loads(line)
+            model = data["model"]
+            if model == self.post_model._meta.label_lower:
+                post = self._load(self.post_model, self.post_fields, data)
+                self.posts.append((post, data.get("users", [])))
+            elif self.translation_model is not None and model == self.translation_model._meta.label_lower:
+                translation = self._load(self.translation_model, self.translation_fields, data)
+                self.translations.append((translation, data["post"]))
+            else:
+                raise ValueError("unexpected model %r" % model)
+        except (KeyError, TypeError, ValueError, ValidationError) as err:
+            self.errors.append((lineno, err))
+        if len(self.posts) + len(self.translations) >= self.batch_size:
+            self.flush()
+
+    def _load(self, model, fields, data):
+        obj = model(**{field.name: load_value(field, data["fields"][field.name]) for field in fields})
+        obj.clean_fields(exclude=[field.name for field in model._meta.fields if field not in fields])
+        return obj
+
+    def flush(self):
+        count = len(self.posts) + len(self.translations)
+        with transaction.atomic():
+            self._flush_posts()
+            self._flush_translations()
+        if self.on_flush is not None:
+            self.on_flush(self, count)
+
+    def _flush_posts(self):
+        posts, self.posts = self.posts, []
+        if not posts:
+            return
+        manager = self.post_model._base_manager
+        keys = {"%s__in" % self.key: [getattr(post, self.key) for post, users in posts]}
+
+        existing = dict(manager.filter(**keys).values_list(self.key, "pk"))
+        created, updated = [], []
+        for post, users in posts:
+            post.pk = existing.get(getattr(post, self.key))
+            (created if post.pk is None else updated).append(post)
+        manager.bulk_create(created)
+        manager.bulk_update(updated, [field.name for field in self.post_fields])
+        self.created += len(created)
+        self.updated += len(updated)
+
+        # bulk_create() sets the pks only on some backends
+        pks = dict(manager.filter(**keys).values_list(self.key, "pk"))
+        through, source, target = _get_users(self.post_model)
+        source, target = through._meta.get_field(source).attname, through._meta.get_field(target).attname
+        User = get_user_model()
+        usernames = {name for post, names in posts for name in names}
+        users = dict(
+            User._base_manager.filter(**{"%s__in" % User.USERNAME_FIELD: usernames}).values_list(
+                User.USERNAME_FIELD, "pk"
+            )
+        )
+        through._base_manager.filter(**{"%s__in" % source: pks.values()}).delete()
+        through._base_manager.bulk_create(
+            [
+                through(**{source: pks[getattr(post, self.key)], target: users[name]})
+                for post, names in posts
+                for name in names
+                if name in users
+            ]
+        )
+        manager.filter(pk__in=pks.values()).update(is_restricted=get_restricted(self.post_model))
+        # fail closed: a post restricted to unknown users stays hidden to everybody
+        for name in usernames - set(users):
+            self.errors.append((None, ValueError("no user %r" % name)))
+        restricted = [pks[getattr(post, self.key)] for post, names in posts if names]
+        manager.filter(pk__in=restricted, is_restricted=False).update(is_restricted=True)
+        transaction.on_commit(lambda: invalidate_posts(self.post_model, list(pks.values())))
+        transaction.on_commit(partial(index_all, manager.filter(pk__in=list(pks.values()))))
+
+    def _flush_translations(self):
+        translations, self.translations = self.translations, []
+        if not translations:
+            return
+        manager = self.translation_model._base_manager
+        post = self.translation_model._meta.get_field("post").attname
+
+        posts = dict(
+            self.post_model._base_manager.filter(uuid__in=[uuid for translation, uuid in translations]).values_list(
+                "uuid", "pk"
+            )
+        )
+        existing = {
+            (post_id, language): pk
+            for post_id, language, pk in manager.filter(**{"%s__in" % post: posts.values()}).values_list(
+                post, "language", "pk"
+            )
+        }
+        created, updated = [], []
+        for translation, uuid in translations:
+            if uuid not in posts:
+                self.errors.append((None, ValueError("no post with uuid %r" % uuid)))
+                continue
+            setattr(translation, post, posts[uuid])
+            translation.pk = existing.get((posts[uuid], translation.language))
+            (created if translation.pk is None else updated).append(translation)
+        manager.bulk_create(created)
+        manager.bulk_update(updated, [field.name for field in self.translation_fields])
+        self.created += len(created)
+        self.updated += len(updated)
+        transaction.on_commit(lambda: invalidate_posts(self.post_model, list(posts.values())))
+        transaction.on_commit(partial(index_all, manager.filter(**{"%s__in" % post: list(posts.values())})))
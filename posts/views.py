@@ -18,38 +18,180 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.core import signing
 from django.core.paginator import EmptyPage, InvalidPage, Paginator
-from django.db.models import Q
-from django.http import Http404
+from django.db.models import QuerySet
+from django.http import Http404, HttpResponse
 from django.shortcuts import render
+from django.utils.cache import add_never_cache_headers, get_conditional_response
+from django.utils.http import http_date
+from django.utils.translation import get_language
 from django.views.generic import View
 
+from . import settings as posts_settings
+from .cache import get_cache, get_etag, get_published_now, get_render_key, get_version
+from .instrumentation import instrument
+from .lookups import aget_post, get_post
+from .pagination import CursorPaginator, InvalidCursor
+from .preview import get_uuid
+from .search import search
+
 
 class PostView(View):
+    # cache the rendered pages; only for templates which do not depend on
+    # the user or the session (e.g. no csrf_token). Pages showing posts
+    # restricted to some users are never cached, and lists are never served
+    # from the cache to users with restricted posts.
+    render_cache = False
+    render_cache_timeout = None
+    # send ETag/Last-Modified and answer conditional requests with a 304
+    # before rendering; as for render_cache, the page must not depend on
+    # the user
+    conditional = False
+
     def process_context(self, request, context=None):
         context = {} if context is None else context
         return context
 
+    def get_conditional_response(self, request, etag=None, last_modified=None):
+        timestamp = None if last_modified is None else int(last_modified.timestamp())
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is not None and response.status_code == 304:
+            self.set_validators(response, etag, last_modified)
+        return response
+
+    def set_validators(self, response, etag=None, last_modified=None):
+        if etag is not None:
+            response["ETag"] = etag
+        if last_modified is not None:
+            response["Last-Modified"] = http_date(last_modified.timestamp())
+        return response
+
+    def get_render_cache_timeout(self):
+        if self.render_cache_timeout is None:
+            return posts_settings.RENDER_CACHE_TIMEOUT
+        return self.render_cache_timeout
+
+    def has_restricted_posts(self, user):
+        """
+        Whether some posts are restricted to ``user``.
+        """
+        if user is None or not user.is_authenticated:
+            return False
+        field = self.post_model._meta.get_field("users")
+        through = field.remote_field.through._base_manager
+        return through.filter(**{field.m2m_reverse_field_name(): user.pk}).exists()
+
+    def get_rendered(self, request, cache_key):
+        rendered = get_cache().get(cache_key)
+        if rendered is not None:
+            content, etag, last_modified = rendered
+            response = self.get_conditional_response(request, etag, last_modified)
+            if response is None:
+                response = self.set_validators(HttpResponse(content), etag, last_modified)
+            return response
+
+    def set_rendered(self, cache_key, response, validators=(None, None), timeout=None):
+        timeout = self.get_render_cache_timeout() if timeout is None else timeout
+        get_cache().set(cache_key, (response.content, *validators), timeout)
+
+    async def aget_user(self, request):
+        # request.user is lazy, loading it in the event loop is a sync query
+        return await request.auser() if hasattr(request, "auser") else None
+
+    async def arender(self, request, template_name, context):
+        # templates may still hit the database (e.g. post.translate()): render
+        # them in the thread where the sync code of the request runs
+        return await sync_to_async(render)(request, template_name, context)
+
 
 class ListView(PostView):
     paginate_by = 25
+    cursor_paginate = False
+    cursor_kwarg = "cursor"
+    # fields loaded for the list, see PostModelQuerySet.for_list(): by
+    # default all but the ``list_deferred_fields`` of the post model
+    only_fields = None
+    defer_fields = None
+    # fetch read only PostRow objects with just these fields instead
+    row_fields = None
     order_by = None
     post_model = None
     translation_model = None
     template_name = "post/list.html"
     object_list_name = "post_list"
 
-    def get_queryset(self, request):
-        return self.post_model.objects.published()
+    def get_queryset(self, request, user=None):
+        user = getattr(request, "user", None) if user is None else user
+        queryset = self.post_model.objects.cached_published().visible_to(user)
+        if self.translation_model is not None:
+            queryset = queryset.with_translation()
+        if self.row_fields is not None:
+            return queryset.rows(*self.row_fields)
+        return queryset.for_list(only=self.only_fields, defer=self.defer_fields)
 
+    def get_render_cache_key(self, request):
+        if self.has_restricted_posts(getattr(request, "user", None)):
+            # the cached pages are shared, their lists hold only public posts
+            return None
+        return get_render_key(
+            self.template_name,
+            self.post_model._meta.label_lower,
+            get_language(),
+            request.GET.get("page"),
+            request.GET.get(self.cursor_kwarg),
+            get_version(self.post_model),
+            # the page also changes when a post enters or leaves its publication window
+            get_published_now(self.post_model),
+        )
+
+    def get_validators(self, request, post_list):
+        rows = post_list.object_list
+        if isinstance(rows, QuerySet):
+            rows = list(rows.values_list("pk", "last_modified_at"))
+        else:
+            rows = [(post.pk, post.last_modified_at) for post in rows]
+        last_modified = max(modified for pk, modified in rows) if rows else None
+        etag = get_etag(self.template_name, get_language(), rows, get_version(self.post_model))
+        return etag, last_modified
+
+    @instrument
     def get(self, request):
+        cache_key = self.get_render_cache_key(request) if self.render_cache else None
+        if cache_key is not None:
+            response = self.get_rendered(request, cache_key)
+            if response is not None:
+                return response
+
         object_list = self.get_queryset(request)
         if self.order_by:
             object_list = object_list.order_by(*self.order_by)
-        paginator = Paginator(object_list, self.paginate_by)
+
+        post_list = self.paginate_queryset(request, object_list)
+
+        validators = self.get_validators(request, post_list) if self.conditional else (None, None)
+        response = self.get_conditional_response(request, *validators)
+        if response is not None:
+            return response
 
         context = self.process_context(request, {self.object_list_name: object_list})
+        context[self.object_list_name] = post_list
+
+        response = self.set_validators(render(request, self.template_name, context), *validators)
+
+        if cache_key is not None:
+            if not any(post.is_restricted for post in post_list):
+                self.set_rendered(cache_key, response, validators)
+
+        return response
+
+    def paginate_queryset(self, request, object_list):
+        if self.cursor_paginate:
+            return self.cursor_paginate_queryset(request, object_list)
+
+        paginator = Paginator(object_list, self.paginate_by)
 
         try:
             page = int(request.GET.get("page", "1"))
@@ -61,7 +203,33 @@ class ListView(PostView):
         except (EmptyPage, InvalidPage):
             post_list = paginator.page(paginator.num_pages)
 
-        context[self.object_list_name] = post_list
+        return post_list
+
+    def cursor_paginate_queryset(self, request, object_list):
+        paginator = CursorPaginator(object_list, self.paginate_by)
+
+        try:
+            post_list = paginator.page(request.GET.get(self.cursor_kwarg))
+        except InvalidCursor:
+            raise Http404
+
+        return post_list
+
+
+class SearchView(ListView):
+    cursor_paginate = False
+    template_name = "post/search.html"
+    query_kwarg = "q"
+    query_name = "query"
+
+    def get(self, request):
+        query = request.GET.get(self.query_kwarg, "").strip()
+
+        object_list = self.get_queryset(request)
+        object_list = search(object_list, query, self.translation_model) if query else object_list.none()
+
+        context = self.process_context(request, {self.object_list_name: object_list, self.query_name: query})
+        context[self.object_list_name] = self.paginate_queryset(request, object_list)
 
         return render(request, self.template_name, context)
 
@@ -72,21 +240,57 @@ class DetailView(PostView):
     template_name = "post/detail.html"
     object_name = "post"
 
+    def get_queryset(self, request, user=None):
+        user = getattr(request, "user", None) if user is None else user
+        return self.post_model.objects.cached_published().visible_to(user)
+
+    @instrument
     def get_object(self, request, slug):
-        q = Q(slug__iexact=slug)
-        if self.translation_model is not None:
-            q |= Q(translations__slug__iexact=slug)
         try:
-            return self.post_model.objects.published().distinct().get(q)
+            return get_post(request, self.get_queryset(request), slug, self.translation_model)
         except self.post_model.DoesNotExist:
             raise Http404
 
+    def get_render_cache_key(self, request, post):
+        if post.is_restricted:
+            return None
+        return get_render_key(
+            self.template_name,
+            post._meta.label_lower,
+            post.pk,
+            post.last_modified_at,
+            get_language(),
+            get_version(self.post_model, post.pk),
+        )
+
+    def get_validators(self, request, post):
+        etag = get_etag(
+            self.template_name, post.pk, post.last_modified_at, get_language(), get_version(self.post_model, post.pk)
+        )
+        return etag, post.last_modified_at
+
     def get(self, request, slug):
         post = self.get_object(request, slug)
 
+        validators = self.get_validators(request, post) if self.conditional else (None, None)
+        response = self.get_conditional_response(request, *validators)
+        if response is not None:
+            return response
+
+        cache_key = self.get_render_cache_key(request, post) if self.render_cache else None
+        if cache_key is not None:
+            response = self.get_rendered(request, cache_key)
+            if response is not None:
+                return response
+
         context = self.process_context(request, {self.object_name: post})
 
-        return render(request, self.template_name, context)
+        response = self.set_validators(render(request, self.template_name, context), *validators)
+
+        if cache_key is not None:
+            self.set_rendered(cache_key, response, validators)
+
+        return response
 
 
 if "comments" in settings.INSTALLED_APPS:
@@ -112,7 +316,9 @@ if "comments" in settings.INSTALLED_APPS:
             return context
 
         def post(self, request, slug, *args, **kwargs):
-            post = self.get_object(request, slug)
+            return self.handle_post(request, self.get_object(request, slug))
+
+        def handle_post(self, request, post):
             context = self.process_context(request, {"post": post})
             if self.handle_comment:
                 type = request.POST.get("type")
@@ -134,10 +340,191 @@ if "comments" in settings.INSTALLED_APPS:
 
 
 class PreviewView(DetailView):
-    def get(self, request, slug):
-        token = request.GET.get("token", None)
+    """
+    Any post, drafts included, for the holders of its preview token (see
+    ``PostModel.get_preview_token()``). The rendered page is cached for
+    ``POSTS_PREVIEW_CACHE_TIMEOUT`` seconds per token, until a post changes.
+    """
+
+    token_kwarg = "token"
 
+    def get_preview_queryset(self, request):
+        queryset = self.post_model.objects.all()
+        if self.translation_model is not None:
+            queryset = queryset.with_translation()
+        return queryset
+
+    def get_preview_uuid(self, request):
+        token = request.GET.get(self.token_kwarg, None)
         if not token:
             raise Http404
+        try:
+            return get_uuid(token)
+        except signing.BadSignature:
+            raise Http404
+
+    def check_slug(self, post, slug):
+        if slug.lower() not in (post.slug, post.translate().slug):
+            raise Http404
+
+    def get_preview_cache_key(self, request, slug):
+        return get_render_key(
+            "preview",
+            self.template_name,
+            self.post_model._meta.label_lower,
+            slug.lower(),
+            request.GET.get(self.token_kwarg),
+            get_language(),
+            get_version(self.post_model),
+        )
+
+    def get(self, request, slug):
+        uuid = self.get_preview_uuid(request)
+
+        cache_key = self.get_preview_cache_key(request, slug)
+        content = get_cache().get(cache_key)
+        if content is not None:
+            response = HttpResponse(content)
+        else:
+            try:
+                post = self.get_preview_queryset(request).get(uuid=uuid)
+            except self.post_model.DoesNotExist:
+                raise Http404
+            self.check_slug(post, slug)
+
+            context = self.process_context(request, {self.object_name: post})
+            response = render(request, self.template_name, context)
+            get_cache().set(cache_key, response.content, posts_settings.PREVIEW_CACHE_TIMEOUT)
+
+        add_never_cache_headers(response)
+        return response
+
+
+class AsyncListView(ListView):
+    """
+    ``ListView`` for ASGI: the posts are fetched with the async ORM, the
+    cache, ``process_context()`` and the template run in the sync thread.
+    """
+
+    async def get(self, request):
+        cache_key = await sync_to_async(self.get_render_cache_key)(request) if self.render_cache else None
+        if cache_key is not None:
+            response = await sync_to_async(self.get_rendered)(request, cache_key)
+            if response is not None:
+                return response
+
+        # the publication window may need a query
+        object_list = await sync_to_async(self.get_queryset)(request, await self.aget_user(request))
+        if self.order_by:
+            object_list = object_list.order_by(*self.order_by)
+
+        post_list = await self.apaginate_queryset(request, object_list)
+
+        validators = await sync_to_async(self.get_validators)(request, post_list) if self.conditional else (None, None)
+        response = self.get_conditional_response(request, *validators)
+        if response is not None:
+            return response
+
+        context = await sync_to_async(self.process_context)(request, {self.object_list_name: object_list})
+        context[self.object_list_name] = post_list
+
+        response = self.set_validators(await self.arender(request, self.template_name, context), *validators)
+
+        if cache_key is not None:
+            if not any(post.is_restricted for post in post_list):
+                await sync_to_async(self.set_rendered)(cache_key, response, validators)
+
+        return response
+
+    async def apaginate_queryset(self, request, object_list):
+        if self.cursor_paginate:
+            paginator = CursorPaginator(object_list, self.paginate_by)
+            try:
+                return await paginator.apage(request.GET.get(self.cursor_kwarg))
+            except InvalidCursor:
+                raise Http404
+
+        paginator = Paginator(object_list, self.paginate_by)
+        paginator.count = await object_list.acount()
+
+        try:
+            page = int(request.GET.get("page", "1"))
+        except ValueError:
+            page = 1
+
+        try:
+            post_list = paginator.page(page)
+        except (EmptyPage, InvalidPage):
+            post_list = paginator.page(paginator.num_pages)
+
+        post_list.object_list = [post async for post in post_list.object_list]
+        return post_list
+
+
+class AsyncDetailView(DetailView):
+    """
+    ``DetailView`` for ASGI, see ``AsyncListView``.
+    """
+
+    async def aget_object(self, request, slug):
+        try:
+            queryset = await sync_to_async(self.get_queryset)(request, await self.aget_user(request))
+            return await aget_post(request, queryset, slug, self.translation_model)
+        except self.post_model.DoesNotExist:
+            raise Http404
+
+    async def get(self, request, slug):
+        post = await self.aget_object(request, slug)
+
+        validators = await sync_to_async(self.get_validators)(request, post) if self.conditional else (None, None)
+        response = self.get_conditional_response(request, *validators)
+        if response is not None:
+            return response
+
+        cache_key = await sync_to_async(self.get_render_cache_key)(request, post) if self.render_cache else None
+        if cache_key is not None:
+            response = await sync_to_async(self.get_rendered)(request, cache_key)
+            if response is not None:
+                return response
+
+        context = await sync_to_async(self.process_context)(request, {self.object_name: post})
+
+        response = self.set_validators(await self.arender(request, self.template_name, context), *validators)
+
+        if cache_key is not None:
+            await sync_to_async(self.set_rendered)(cache_key, response, validators)
+
+        return response
+
+
+if "comments" in settings.INSTALLED_APPS:
+
+    class AsyncDetailView(AsyncDetailView):
+        async def post(self, request, slug, *args, **kwargs):
+            post = await self.aget_object(request, slug)
+            # comment forms are sync code
+            return await sync_to_async(self.handle_post)(request, post)
+
+
+class AsyncPreviewView(PreviewView, AsyncDetailView):
+    async def get(self, request, slug):
+        uuid = self.get_preview_uuid(request)
+
+        cache_key = await sync_to_async(self.get_preview_cache_key)(request, slug)
+        content = await get_cache().aget(cache_key)
+        if content is not None:
+            response = HttpResponse(content)
+        else:
+            try:
+                post = await self.get_preview_queryset(request).aget(uuid=uuid)
+            except self.post_model.DoesNotExist:
+                raise Http404
+            # post.translate() may query the translations
+            await sync_to_async(self.check_slug)(post, slug)
+
+            context = await sync_to_async(self.process_context)(request, {self.object_name: post})
+            response = await self.arender(request, self.template_name, context)
+            await get_cache().aset(cache_key, response.content, posts_settings.PREVIEW_CACHE_TIMEOUT)
 
-        return super().get(request, slug)
+        add_never_cache_headers(response)
+        return response
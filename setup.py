@@ -10,7 +10,7 @@ with io.open("README.md", "rt", encoding="utf-8") as fp:
 
 
 setup(
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks", "benchmarks.*"]),
     include_package_data=True,
     name="django-fluo-posts",
     version=posts.__version__,